@@ -0,0 +1,29 @@
+"""
+Performance benchmarks for Django-Select2.
+
+The benchmarks generate large synthetic datasets for the test application's
+models and measure widget rendering, lookup latency, registry payload sizes
+and registry throughput for different cache backends. Run them with::
+
+    python -m benchmarks --rows 100000 --output results.json
+
+See ``python -m benchmarks --help`` for all options. Concurrent typing sessions
+can be replayed against a local server with::
+
+    python -m benchmarks.load --rows 10000 --workers 16 --sessions 500
+"""
+import os
+
+
+def setup(database=None):
+    """Configure Django for the benchmarks and create the database tables."""
+    if database:
+        os.environ["BENCHMARK_DATABASE_URL"] = database
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "benchmarks.settings")
+
+    import django
+    from django.core.management import call_command
+
+    django.setup()
+    call_command("migrate", run_syncdb=True, verbosity=0)
+    call_command("createcachetable", verbosity=0)
@@ -0,0 +1,106 @@
+"""Generate large synthetic datasets for the test application's models."""
+import random
+import string
+
+BATCH_SIZE = 10000
+
+SYLLABLES = (
+    "ka lo mi ne ra su to vi ze an bel cor dra el fin gar hel is jor kel lum mor nor"
+).split()
+
+
+def random_word(rng, syllables=3):
+    return "".join(rng.choice(SYLLABLES) for _ in range(syllables)).capitalize()
+
+
+def random_title(rng, words=3):
+    return " ".join(
+        random_word(rng, rng.randint(1, 4)) for _ in range(rng.randint(1, words))
+    )
+
+
+def bulk_create(model, objects):
+    batch = []
+    for obj in objects:
+        batch.append(obj)
+        if len(batch) >= BATCH_SIZE:
+            model.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        model.objects.bulk_create(batch)
+
+
+def generate(rows, seed=0):
+    """
+    Create ``rows`` artists, albums and cities, as well as genres and countries.
+
+    The data is deterministic for a given ``seed``. Existing data is deleted.
+
+    Returns:
+        dict: Number of rows by model name.
+
+    """
+    from tests.testapp.models import Album, Artist, City, Country, Genre
+
+    rng = random.Random(seed)
+    for model in (Album, Artist, Genre, City, Country):
+        model.objects.all().delete()
+
+    genres = max(10, rows // 1000)
+    countries = max(10, rows // 10000)
+    bulk_create(
+        Genre, (Genre(pk=pk, title=random_title(rng, 2)[:50]) for pk in range(genres))
+    )
+    bulk_create(
+        Artist,
+        (
+            # Titles are unique, append the primary key.
+            Artist(pk=pk, title="%s %d" % (random_title(rng, 2)[:40], pk))
+            for pk in range(rows)
+        ),
+    )
+    bulk_create(
+        Album,
+        (
+            Album(
+                pk=pk,
+                title=random_title(rng, 4),
+                artist_id=rng.randrange(rows),
+                primary_genre_id=rng.randrange(genres),
+            )
+            for pk in range(rows)
+        ),
+    )
+    bulk_create(
+        Country,
+        (Country(pk=pk, name=random_title(rng, 2)) for pk in range(countries)),
+    )
+    bulk_create(
+        City,
+        (
+            City(pk=pk, name=random_title(rng, 2), country_id=rng.randrange(countries))
+            for pk in range(rows)
+        ),
+    )
+    return {
+        "genre": genres,
+        "artist": rows,
+        "album": rows,
+        "country": countries,
+        "city": rows,
+    }
+
+
+def random_terms(length, count, seed=0):
+    """Return search terms of the given length, that occur in the generated data."""
+    rng = random.Random(seed)
+    if length == 0:
+        return [""] * count
+    terms = []
+    while len(terms) < count:
+        word = random_word(rng, 3).lower()
+        start = rng.randrange(max(1, len(word) - length + 1))
+        term = word[start : start + length]
+        if len(term) == length and all(c in string.ascii_lowercase for c in term):
+            terms.append(term)
+    return terms
@@ -0,0 +1,336 @@
+"""
+Replay concurrent typing sessions against the autocomplete endpoint.
+
+Each session emulates a user interacting with a heavy widget: typing a search
+term one keystroke at a time, scrolling through the result pages or changing
+the value of a parent field of a dependent widget. The sessions are replayed
+from many threads or processes against a threaded server on localhost.
+
+The report contains the throughput, latency percentiles, database queries per
+request and every failed or inconsistent response. Inconsistent responses,
+different results for identical requests, point to thread safety issues in
+the widget reconstruction or the cache.
+"""
+import argparse
+import json
+import random
+import statistics
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode
+from urllib.request import urlopen
+
+from . import setup
+from .data import random_word
+
+QUERY_COUNT_HEADER = "X-Query-Count"
+
+
+class QueryCountMiddleware:
+    """WSGI middleware adding the number of database queries to the response."""
+
+    def __init__(self, application):
+        self.application = application
+
+    def __call__(self, environ, start_response):
+        from django.db import connection
+
+        queries = []
+
+        def count(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        def start(status, headers, exc_info=None):
+            headers.append((QUERY_COUNT_HEADER, str(len(queries))))
+            return start_response(status, headers, exc_info)
+
+        with connection.execute_wrapper(count):
+            return self.application(environ, start)
+
+
+def start_server(host="127.0.0.1", port=0):
+    """
+    Start a threaded WSGI server in a background thread.
+
+    Returns:
+        tuple: The server and its base URL.
+
+    """
+    from django.core.handlers.wsgi import WSGIHandler
+    from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+
+    class QuietRequestHandler(WSGIRequestHandler):
+        def log_message(self, *args):
+            pass
+
+    server = ThreadedWSGIServer((host, port), QuietRequestHandler)
+    server.daemon_threads = True
+    server.set_app(QueryCountMiddleware(WSGIHandler()))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, "http://%s:%d" % server.server_address[:2]
+
+
+def register_widgets():
+    """
+    Render the widgets used in the sessions to register them.
+
+    Returns:
+        dict: Field id by widget name and the primary keys of all countries.
+
+    """
+    from django_select2.forms import ModelSelect2Widget
+    from tests.testapp.models import Artist, City, Country
+
+    artist = ModelSelect2Widget(
+        queryset=Artist.objects.all(),
+        search_fields=["title__icontains"],
+        max_results=25,
+    )
+    city = ModelSelect2Widget(
+        queryset=City.objects.all(),
+        search_fields=["name__icontains"],
+        dependent_fields={"country": "country"},
+        max_results=25,
+    )
+    for widget in (artist, city):
+        widget.render("field", None)
+    return {
+        "artist": artist.field_id,
+        "city": city.field_id,
+        "countries": list(Country.objects.values_list("pk", flat=True)),
+    }
+
+
+def typing_session(rng, widgets):
+    """Type a word one keystroke at a time, skipping debounced keystrokes."""
+    word = random_word(rng, rng.randint(2, 4)).lower()
+    requests = []
+    for length in range(1, len(word) + 1):
+        if length < len(word) and rng.random() < 0.3:
+            continue
+        requests.append({"field_id": widgets["artist"], "term": word[:length]})
+    return requests
+
+
+def scroll_session(rng, widgets, pages=10):
+    """Open the dropdown and scroll through the result pages."""
+    term = random_word(rng, 1).lower() if rng.random() < 0.5 else ""
+    return [
+        {"field_id": widgets["artist"], "term": term, "page": page}
+        for page in range(1, rng.randint(2, pages) + 1)
+    ]
+
+
+def dependent_session(rng, widgets, changes=3):
+    """Change the parent field repeatedly and search the dependent field."""
+    requests = []
+    for _ in range(changes):
+        country = rng.choice(widgets["countries"])
+        for term in ("", random_word(rng, 1).lower()):
+            requests.append(
+                {"field_id": widgets["city"], "term": term, "country": country}
+            )
+    return requests
+
+
+SESSIONS = {
+    "typing": typing_session,
+    "scroll": scroll_session,
+    "dependent": dependent_session,
+}
+
+
+def build_sessions(count, widgets, seed=0, kinds=tuple(SESSIONS)):
+    """Return ``count`` deterministic sessions as ``(kind, requests)`` tuples."""
+    rng = random.Random(seed)
+    sessions = []
+    for _ in range(count):
+        kind = rng.choice(kinds)
+        sessions.append((kind, SESSIONS[kind](rng, widgets)))
+    return sessions
+
+
+def run_session(base_url, path, session):
+    """
+    Replay a session and return a record for each request.
+
+    Like the client, the session stops scrolling after the last page.
+    """
+    kind, requests = session
+    records = []
+    for params in requests:
+        if params.get("page", 1) > 1 and not (records and records[-1].get("more")):
+            break
+        url = "%s%s?%s" % (base_url, path, urlencode(params))
+        record = {"kind": kind, "params": params, "error": None, "results": None}
+        start = time.perf_counter()
+        try:
+            with urlopen(url, timeout=30) as response:  # nosec
+                body = response.read()
+                record["status"] = response.status
+                record["queries"] = response.headers.get(QUERY_COUNT_HEADER)
+        except HTTPError as e:
+            body = e.read()
+            record["status"] = e.code
+            record["queries"] = e.headers.get(QUERY_COUNT_HEADER)
+        except (URLError, OSError) as e:
+            body = b""
+            record["status"] = None
+            record["queries"] = None
+            record["error"] = str(e)
+        record["latency"] = time.perf_counter() - start
+        if record["status"] == 200:
+            try:
+                data = json.loads(body.decode("utf-8"))
+                record["results"] = [result["id"] for result in data["results"]]
+                record["more"] = data["more"]
+            except (ValueError, KeyError, TypeError) as e:
+                record["error"] = "Invalid response: %s" % e
+        if record["queries"] is not None:
+            record["queries"] = int(record["queries"])
+        records.append(record)
+    return records
+
+
+def run(base_url, path, sessions, workers=8, processes=False):
+    """
+    Replay ``sessions`` concurrently.
+
+    Returns:
+        tuple: All request records and the wall clock duration in seconds.
+
+    """
+    executor_class = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    start = time.perf_counter()
+    with executor_class(max_workers=workers) as executor:
+        futures = [
+            executor.submit(run_session, base_url, path, session)
+            for session in sessions
+        ]
+        records = [record for future in futures for record in future.result()]
+    return records, time.perf_counter() - start
+
+
+def report(records, duration):
+    """Summarize the request records."""
+    from .suites import percentile
+
+    def summary(records):
+        latencies = [r["latency"] for r in records]
+        queries = [r["queries"] for r in records if r["queries"] is not None]
+        return {
+            "requests": len(records),
+            "statuses": dict(Counter(str(r["status"]) for r in records)),
+            "latency_ms": {
+                "median": statistics.median(latencies) * 1000,
+                "p95": percentile(latencies, 95) * 1000,
+                "p99": percentile(latencies, 99) * 1000,
+                "max": max(latencies) * 1000,
+            },
+            "queries": {
+                "mean": statistics.mean(queries) if queries else None,
+                "max": max(queries) if queries else None,
+            },
+        }
+
+    responses = defaultdict(set)
+    for record in records:
+        if record["results"] is not None:
+            key = json.dumps(record["params"], sort_keys=True)
+            responses[key].add(tuple(record["results"]))
+    kinds = defaultdict(list)
+    for record in records:
+        kinds[record["kind"]].append(record)
+    return {
+        "duration": duration,
+        "throughput": len(records) / duration,
+        **summary(records),
+        "kinds": {kind: summary(group) for kind, group in kinds.items()},
+        "errors": [
+            {"params": r["params"], "status": r["status"], "error": r["error"]}
+            for r in records
+            if r["error"] or r["status"] != 200
+        ],
+        "inconsistent": sorted(
+            key for key, results in responses.items() if len(results) > 1
+        ),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.load", description=__doc__
+    )
+    parser.add_argument(
+        "--rows",
+        type=int,
+        default=10000,
+        help="number of artists, albums and cities to generate",
+    )
+    parser.add_argument("--database", help="database URL, see python -m benchmarks")
+    parser.add_argument(
+        "--reuse-data",
+        action="store_true",
+        help="skip data generation and use the existing database",
+    )
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument(
+        "--processes",
+        action="store_true",
+        help="replay the sessions from processes instead of threads",
+    )
+    parser.add_argument(
+        "--kind", action="append", choices=sorted(SESSIONS), dest="kinds"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the report to this file")
+    args = parser.parse_args(argv)
+
+    setup(args.database)
+
+    from django.urls import reverse
+
+    from . import data
+
+    if not args.reuse_data:
+        data.generate(args.rows, seed=args.seed)
+    widgets = register_widgets()
+    sessions = build_sessions(
+        args.sessions, widgets, seed=args.seed, kinds=args.kinds or tuple(SESSIONS)
+    )
+    server, base_url = start_server()
+    try:
+        records, duration = run(
+            base_url,
+            reverse("django_select2:auto-json"),
+            sessions,
+            workers=args.workers,
+            processes=args.processes,
+        )
+    finally:
+        server.shutdown()
+    output = json.dumps(
+        {
+            "workers": args.workers,
+            "processes": args.processes,
+            "sessions": args.sessions,
+            **report(records, duration),
+        },
+        indent=2,
+    )
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        sys.stdout.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+"""Benchmark suites, each returning a list of result records."""
+import json
+import os
+import pickle  # nosec
+import statistics
+import subprocess  # nosec
+import sys
+import time
+from contextlib import contextmanager
+from unittest import mock
+
+from django import forms
+from django.core.cache import caches
+from django.db import connection
+from django.http import Http404
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from django_select2 import views
+from django_select2.forms import (
+    HeavySelect2Mixin,
+    ModelSelect2MultipleWidget,
+    ModelSelect2Widget,
+)
+from django_select2.models import WidgetRegistration
+from django_select2.registry import get_registry
+from tests.testapp.models import Album, Artist, City
+
+from .data import random_terms
+
+
+def result(benchmark, metric, value, unit, **params):
+    return {
+        "benchmark": benchmark,
+        "params": params,
+        "metric": metric,
+        "value": value,
+        "unit": unit,
+    }
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(percent / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def timings(func, iterations):
+    durations = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def latency_results(benchmark, durations, **params):
+    return [
+        result(
+            benchmark, "median", statistics.median(durations) * 1000, "ms", **params
+        ),
+        result(benchmark, "p95", percentile(durations, 95) * 1000, "ms", **params),
+        result(
+            benchmark, "throughput", len(durations) / sum(durations), "1/s", **params
+        ),
+    ]
+
+
+@contextmanager
+def cache_backend(alias):
+    """Register widgets in the cache backend ``alias``."""
+    with override_settings(SELECT2_CACHE_BACKEND=alias):
+        cache = caches[alias]
+        cache.clear()
+        yield
+        cache.clear()
+
+
+@contextmanager
+def database_registry():
+    """Register widgets in the :class:`.DatabaseRegistry`."""
+    with override_settings(
+        SELECT2_REGISTRY_BACKEND="django_select2.registry.DatabaseRegistry"
+    ):
+        WidgetRegistration.objects.all().delete()
+        yield
+        WidgetRegistration.objects.all().delete()
+
+
+REGISTRIES = {
+    "locmem": lambda: cache_backend("locmem"),
+    "file": lambda: cache_backend("file"),
+    "db": lambda: cache_backend("db"),
+    "registry": database_registry,
+}
+
+
+def artist_widget(**kwargs):
+    return ModelSelect2Widget(
+        queryset=Artist.objects.all(), search_fields=["title__icontains"], **kwargs
+    )
+
+
+def render_throughput(iterations):
+    """Measure renders of heavy widgets with and without a selected value."""
+    artist_pk = Artist.objects.values_list("pk", flat=True).first()
+    album_pks = list(Album.objects.values_list("pk", flat=True)[:25])
+    # Bound to their fields, the widgets render the labels of selected values.
+    widgets = {
+        "ModelSelect2Widget": (
+            forms.ModelChoiceField(Artist.objects.all(), widget=artist_widget()),
+            None,
+        ),
+        "ModelSelect2Widget-selected": (
+            forms.ModelChoiceField(Artist.objects.all(), widget=artist_widget()),
+            [artist_pk],
+        ),
+        "ModelSelect2MultipleWidget-selected": (
+            forms.ModelMultipleChoiceField(
+                Album.objects.all(),
+                widget=ModelSelect2MultipleWidget(search_fields=["title__icontains"]),
+            ),
+            album_pks,
+        ),
+    }
+    results = []
+    for name, (field, selected) in widgets.items():
+        widget = field.widget
+        value = selected if widget.allow_multiple_selected else selected and selected[0]
+        with CaptureQueriesContext(connection) as queries:
+            html = widget.render("field", value)
+        expected = 1 if selected else 0
+        if len(queries) != expected:
+            raise AssertionError(
+                "%s ran %d queries, expected %d." % (name, len(queries), expected)
+            )
+        for pk in selected or []:
+            if 'value="%s" selected' % pk not in html:
+                raise AssertionError("%s did not render option %s." % (name, pk))
+        durations = timings(lambda: widget.render("field", value), iterations)
+        results += latency_results("render", durations, widget=name)
+        results.append(
+            result("render", "queries", len(queries), "queries", widget=name)
+        )
+    return results
+
+
+def lookup_latency(iterations, term_lengths=(0, 1, 2, 3, 5), pages=(1, 10, 100)):
+    """Measure `AutoResponseView` latency by term length and page depth."""
+    widget = artist_widget(max_results=25)
+    widget.render("field", None)
+    url = reverse("django_select2:auto-json")
+    view = views.AutoResponseView.as_view()
+    factory = RequestFactory()
+    results = []
+    for length in term_lengths:
+        for page in pages:
+            terms = iter(random_terms(length, iterations, seed=length))
+            statuses = []
+
+            def lookup():
+                request = factory.get(
+                    url,
+                    {"field_id": widget.field_id, "term": next(terms), "page": page},
+                )
+                try:
+                    statuses.append(view(request).status_code)
+                except Http404:
+                    statuses.append(404)
+
+            durations = timings(lookup, iterations)
+            results += latency_results(
+                "lookup", durations, term_length=length, page=page
+            )
+            results.append(
+                result(
+                    "lookup",
+                    "not_found",
+                    statuses.count(404),
+                    "requests",
+                    term_length=length,
+                    page=page,
+                )
+            )
+    return results
+
+
+def registry_payload_sizes():
+    """Measure the size of pickled registry entries."""
+    widgets = {
+        "all": artist_widget(),
+        "filtered": ModelSelect2Widget(
+            queryset=Album.objects.filter(
+                title__startswith="Ka", primary_genre__isnull=False
+            ).exclude(artist__title__icontains="lo"),
+            search_fields=["title__icontains", "artist__title__icontains"],
+        ),
+        "dependent": ModelSelect2Widget(
+            queryset=City.objects.all(),
+            search_fields=["name__icontains"],
+            dependent_fields={"country": "country"},
+        ),
+    }
+    results = []
+    for name, widget in widgets.items():
+        with mock.patch.object(HeavySelect2Mixin, "_register") as register:
+            widget.set_to_cache()
+        payload = register.call_args[0][0]
+        size = len(pickle.dumps(payload, pickle.HIGHEST_PROTOCOL))
+        results.append(result("registry_payload", "size", size, "bytes", widget=name))
+    return results
+
+
+def cache_backend_throughput(iterations, backends=tuple(REGISTRIES)):
+    """
+    Measure registry writes and reads for different backends.
+
+    ``locmem``, ``file`` and ``db`` are cache backends of the
+    :class:`.CacheRegistry`, ``registry`` is the :class:`.DatabaseRegistry`.
+    """
+    url = reverse("django_select2:auto-json")
+    factory = RequestFactory()
+    results = []
+    for backend in backends:
+        with REGISTRIES[backend]():
+            widgets = [artist_widget() for _ in range(iterations)]
+            durations = timings(lambda: widgets.pop().set_to_cache(), iterations)
+            results += latency_results("registry_write", durations, backend=backend)
+
+            widget = artist_widget()
+            widget.set_to_cache()
+
+            def read():
+                view = views.AutoResponseView()
+                view.setup(factory.get(url, {"field_id": widget.field_id}))
+                view.get_widget_or_404()
+
+            durations = timings(read, iterations)
+            results += latency_results("registry_read", durations, backend=backend)
+    return results
+
+
+def registry_purge(rows):
+    """Measure purging ``rows`` expired widgets from the :class:`.DatabaseRegistry`."""
+    with database_registry():
+        registry = get_registry()
+        with mock.patch.object(registry, "timeout", -1):
+            for _ in range(rows):
+                artist_widget().set_to_cache()
+        start = time.perf_counter()
+        deleted = registry.purge()
+        duration = time.perf_counter() - start
+    return [
+        result("registry_purge", "duration", duration * 1000, "ms", rows=rows),
+        result("registry_purge", "deleted", deleted, "rows", rows=rows),
+    ]
+
+
+IMPORT_CODE = """
+import json, sys, time
+import django
+django.setup()
+start = time.perf_counter()
+import django_select2.forms, django_select2.views
+duration = time.perf_counter() - start
+print(json.dumps({"duration": duration, "admin": "django.contrib.admin" in sys.modules}))
+"""
+
+
+def import_time(iterations):
+    """Measure the import of forms and views in fresh interpreters."""
+    env = dict(os.environ)
+    env.setdefault("DJANGO_SETTINGS_MODULE", "benchmarks.settings")
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    durations, admin = [], False
+    for _ in range(iterations):
+        output = subprocess.check_output(
+            [sys.executable, "-c", IMPORT_CODE], env=env, cwd=root
+        )
+        data = json.loads(output.decode("utf-8").splitlines()[-1])
+        durations.append(data["duration"])
+        admin |= data["admin"]
+    return [
+        result("import", "median", statistics.median(durations) * 1000, "ms"),
+        result("import", "p95", percentile(durations, 95) * 1000, "ms"),
+        result("import", "admin_imported", int(admin), "bool"),
+    ]
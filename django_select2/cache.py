@@ -9,6 +9,8 @@ Select2 uses the cache backend defined in the setting
 
 It is advised to always setup a separate cache server for Select2.
 
+The cache backend is resolved on first use, not when this module is imported.
+
 .. _django.core.cache: https://docs.djangoproject.com/en/dev/topics/cache/
 """
 from django.core.cache import caches
@@ -17,4 +19,29 @@ from .conf import settings
 
 __all__ = ("cache",)
 
-cache = caches[settings.SELECT2_CACHE_BACKEND]
+
+class Select2CacheProxy:
+    """
+    Proxy access to the cache backend defined in ``SELECT2_CACHE_BACKEND``.
+
+    Like Django's default cache, the backend is looked up on every access,
+    which also respects a changed setting and thread-local connections.
+    """
+
+    def __getattr__(self, name):
+        return getattr(caches[settings.SELECT2_CACHE_BACKEND], name)
+
+    def __setattr__(self, name, value):
+        return setattr(caches[settings.SELECT2_CACHE_BACKEND], name, value)
+
+    def __delattr__(self, name):
+        return delattr(caches[settings.SELECT2_CACHE_BACKEND], name)
+
+    def __contains__(self, key):
+        return key in caches[settings.SELECT2_CACHE_BACKEND]
+
+    def __eq__(self, other):
+        return caches[settings.SELECT2_CACHE_BACKEND] == other
+
+
+cache = Select2CacheProxy()
@@ -0,0 +1,125 @@
+"""
+Coalescing of identical concurrent lookups.
+
+When many clients send the same lookup at the same time, only one of them
+needs to query the database. The others wait for the in-flight computation
+and share its result.
+
+Within a process, waiting requests are coordinated by :class:`.SingleFlight`.
+Across processes and machines, :func:`.coalesce` uses a short lock in the
+select2 cache backend and shares the result through the cache. Results
+are only shared with lookups waiting for them, they are not cached.
+"""
+import threading
+import time
+import uuid
+
+from .cache import cache
+from .conf import settings
+
+__all__ = ("SingleFlight", "coalesce")
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight:
+    """Run a function only once for concurrent calls with the same key."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func, timeout=None):
+        """
+        Return result of ``func``, shared among all concurrent calls with ``key``.
+
+        Args:
+            key (str): Key identifying identical calls.
+            func (callable): Function computing the result.
+            timeout (float): Seconds to wait for an in-flight call, before
+                calling ``func`` independently.
+
+        Returns:
+            Result of ``func``.
+
+        Raises:
+            Exception: Any exception raised by ``func``.
+
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = self._calls[key] = _Call()
+
+        if not is_leader:
+            if not call.event.wait(timeout):
+                return func()
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        try:
+            call.value = func()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.value
+
+
+single_flight = SingleFlight()
+
+POLL_INTERVAL = 0.05
+RESULT_TIMEOUT = 1
+
+
+def _coalesce_shared(key, func, timeout):
+    lock_key = "%scoalesce_lock_%s" % (settings.SELECT2_CACHE_PREFIX, key)
+    flight = uuid.uuid4().hex
+    if cache.add(lock_key, flight, timeout):
+        try:
+            result = func()
+            # Kept only long enough for the waiting processes to pick it up.
+            cache.set(_result_key(flight), result, RESULT_TIMEOUT)
+        finally:
+            cache.delete(lock_key)
+        return result
+
+    flight = cache.get(lock_key)
+    deadline = time.monotonic() + timeout
+    while flight is not None and time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        result = cache.get(_result_key(flight))
+        if result is not None:
+            return result
+        if cache.get(lock_key) != flight:
+            # The other process failed or its result expired already.
+            break
+    return func()
+
+
+def _result_key(flight):
+    return "%scoalesce_result_%s" % (settings.SELECT2_CACHE_PREFIX, flight)
+
+
+def coalesce(key, func):
+    """
+    Return result of ``func``, shared among identical concurrent lookups.
+
+    See :attr:`.COALESCE_LOOKUPS` and :attr:`.COALESCE_SHARED`.
+    """
+    timeout = settings.SELECT2_COALESCE_TIMEOUT
+    if settings.SELECT2_COALESCE_SHARED:
+        return single_flight.do(
+            key, lambda: _coalesce_shared(key, func, timeout), timeout
+        )
+    return single_flight.do(key, func, timeout)
@@ -56,6 +56,201 @@ class Select2Conf(AppConf):
     It has set `select2_` as a default value, which you can change if needed.
     """
 
+    REGISTRY_BACKEND = "django_select2.registry.CacheRegistry"
+    """
+    Import path of the registry storing the widgets for the JSON response view.
+
+    By default, widgets are stored in the cache backend defined in
+    :attr:`.CACHE_BACKEND`. Without a cache server, use
+    ``django_select2.registry.DatabaseRegistry`` instead of Django's
+    ``DatabaseCache``. See :mod:`django_select2.registry` for details.
+    """
+
+    REGISTRY_DEDUPLICATE = False
+    """
+    Store widgets that only differ in their instance once.
+
+    Widgets are stored under a hash of their content and every render only
+    stores a small pointer. The registry then grows with the number of
+    distinct widgets instead of the number of renders. Readers keep the
+    resolved widgets in memory, see :class:`.BaseRegistry`.
+
+    Only model widgets are deduplicated, other heavy widgets are registered
+    with their instance.
+    """
+
+    REGISTRY_COMPRESS_THRESHOLD = None
+    """
+    Compress registry entries whose pickle is larger than this number of bytes.
+
+    Large QuerySet filters can exceed the item size limit of memcached or
+    bloat Redis. Compression is disabled by default.
+    """
+
+    REGISTRY_COMPRESSION = "zlib"
+    """
+    Compression of large registry entries, ``zlib`` or ``lzma``.
+
+    ``lzma`` compresses better, but is slower.
+    """
+
+    REGISTRY_MAX_SIZE = None
+    """
+    Maximum size of a registry entry in bytes, after compression.
+
+    Memcached's default item size limit is 1MB. There is no limit by default.
+    """
+
+    REGISTRY_MAX_SIZE_ACTION = "raise"
+    """
+    Raise :class:`.RegistryPayloadTooLarge` when rendering a widget exceeding
+    :attr:`.REGISTRY_MAX_SIZE` or log a ``warning`` and register it anyway.
+    """
+
+    DATABASE = None
+    """
+    Database alias of the lookups of :class:`.AutoResponseView`.
+
+    Lookups are read-only and can run on a replica or a dedicated search
+    database, while the routers pick the database of all other queries.
+    Widgets can override the alias with :attr:`.ModelSelect2Mixin.using`.
+
+    Example of settings.py::
+
+        SELECT2_DATABASE = "replica"
+    """
+
+    QUERY_TIMEOUT = None
+    """
+    Seconds after which the queries of a lookup are canceled.
+
+    Lookups that time out respond with no results and ``"timed_out": true``
+    instead of holding a database connection. Widgets can override the
+    timeout with :attr:`.ModelSelect2Mixin.query_timeout`.
+    See :mod:`django_select2.timeouts` for the supported databases.
+
+    Example of settings.py::
+
+        SELECT2_QUERY_TIMEOUT = 2
+    """
+
+    STATELESS_TOKENS = False
+    """
+    Encode simple model widgets into their ``field_id`` instead of registering them.
+
+    The lookups of these widgets need no registry access and survive cache
+    evictions and restarts. Tokens are JSON signed with the ``SECRET_KEY``,
+    but not encrypted, and expire after the registry's timeout. Only widgets
+    whose QuerySet is their model's default QuerySet are encoded. All other
+    widgets and those whose token is larger than
+    :attr:`.STATELESS_TOKEN_MAX_SIZE` are registered as usual.
+    See :mod:`django_select2.registry`.
+    """
+
+    STATELESS_TOKEN_MAX_SIZE = 2048
+    """
+    Maximal length of a ``field_id`` token, see :attr:`.STATELESS_TOKENS`.
+
+    The token is sent with every lookup as a query parameter.
+    """
+
+    OPTION_CACHE_SIZE = 32
+    """
+    Maximum number of choice lists whose rendered options are kept in memory.
+
+    Applies only to widgets with :attr:`.Select2Mixin.cache_options` enabled.
+    Each entry holds the markup of all options of one set of choices in one
+    language. The least recently used entry is dropped first.
+    """
+
+    AJAX_DELAY = 250
+    """
+    Milliseconds heavy widgets wait after the last keystroke before sending a lookup.
+
+    Select2 would send a lookup for every keystroke otherwise. The delay can
+    be changed per widget using the ``data-ajax--delay`` attribute. Lookups
+    that are still in flight when a newer term is sent, are aborted.
+    """
+
+    THROTTLE_RATE = None
+    """
+    Maximum sustained number of lookups per second a single client may send to one field.
+
+    Throttling is disabled by default. Clients are identified by their user,
+    session or IP address. Each client and field combination is granted a
+    token bucket of :attr:`.THROTTLE_BURST` lookups that refills at this
+    rate. The buckets are stored in the select2 cache backend.
+
+    Throttled lookups receive an empty response with the status code
+    ``429`` and a ``Retry-After`` header. ``django_select2.js`` waits
+    accordingly before it retries the lookup.
+
+    Example of settings.py::
+
+        SELECT2_THROTTLE_RATE = 5
+    """
+
+    THROTTLE_BURST = 10
+    """Number of lookups a client may send in quick succession before being throttled."""
+
+    COALESCE_LOOKUPS = False
+    """
+    Share the result of identical concurrent lookups within a process.
+
+    When a popular page loads, many clients send the same lookup at the same
+    moment. If enabled, only one of them queries the database, while the
+    others wait for its result. Lookups are identical if they are sent to
+    the same URL with the same parameters.
+
+    .. warning:: Do not enable coalescing, if your widgets filter the results
+        based on the request, e.g. on the current user, in
+        :func:`.ModelSelect2Mixin.filter_queryset`.
+    """
+
+    COALESCE_SHARED = False
+    """
+    Share the result of identical concurrent lookups across processes.
+
+    Requires :attr:`.COALESCE_LOOKUPS`. A short lock in the select2 cache
+    backend makes sure that only one process queries the database.
+    """
+
+    COALESCE_TIMEOUT = 5
+    """Maximum number of seconds a lookup waits for an identical in-flight lookup."""
+
+    SERVER_TIMING = False
+    """
+    Report the duration of each lookup phase in a ``Server-Timing`` response header.
+
+    The header is shown in the network panel of the browser's developer tools.
+    The timings are also sent via :mod:`django_select2.signals`, regardless
+    of this setting.
+    """
+
+    METRICS_COLLECTOR = "django_select2.metrics.InMemoryCollector"
+    """
+    Import path of the collector receiving Django-Select2's metrics.
+
+    See :mod:`django_select2.metrics` for the available metrics and how to
+    export them. Set to ``None`` to disable metrics.
+    """
+
+    PROFILE_RATE = None
+    """
+    Profile one in ``PROFILE_RATE`` autocomplete requests, e.g. ``1000``.
+
+    Sampled requests are run with :mod:`cProfile` and the executed SQL is
+    recorded. The results are written to :attr:`.PROFILE_DIR`, see
+    :mod:`django_select2.profiling`. Profiling is disabled by default.
+    """
+
+    PROFILE_DIR = None
+    """
+    Directory the profiles of sampled requests are written to.
+
+    Defaults to ``django_select2_profiles`` in the system's temporary directory.
+    """
+
     JS = "https://cdnjs.cloudflare.com/ajax/libs/select2/{version}/js/select2.min.js".format(
         version=LIB_VERSION
     )
@@ -46,21 +46,93 @@ in their names.
     :parts: 1
 
 """
+import pickle  # nosec
+import threading
 import uuid
+from collections import OrderedDict
 from functools import reduce
 from itertools import chain
-from pickle import PicklingError  # nosec
 
 from django import forms
-from django.contrib.admin.widgets import SELECT2_TRANSLATIONS
 from django.core import signing
+from django.core.exceptions import EmptyResultSet, ValidationError
+from django.core.signals import setting_changed
+from django.db import connections, router, transaction
 from django.db.models import Q
+from django.dispatch import receiver
 from django.forms.models import ModelChoiceIterator
+from django.forms.renderers import get_default_renderer
 from django.urls import reverse
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
 from django.utils.translation import get_language
 
-from .cache import cache
+from . import metrics
 from .conf import settings
+from .registry import dumps_token, get_registry
+
+_I18N_ALIASES = {"zh-hans": "zh-CN", "zh-hant": "zh-TW"}
+
+
+def _get_i18n_name(lang):
+    """
+    Return the name of Select2's translation for a Django language code.
+
+    This mirrors the admin's ``SELECT2_TRANSLATIONS``, without importing
+    :mod:`django.contrib.admin`.
+    """
+    lang = (lang or "").lower()
+    for i18n_name in settings.SELECT2_I18N_AVAILABLE_LANGUAGES:
+        if _I18N_ALIASES.get(lang, lang) == i18n_name or i18n_name.lower() == lang:
+            return i18n_name
+    return None
+
+
+class Select2Media(forms.Media):
+    """
+    Media that is added only once to the media it is added to.
+
+    Forms add up the media of all their widgets. Since all Select2 widgets
+    share the same memoized media, adding it again is a no-op. This spares
+    Django's media merge from ordering the same lists over and over again.
+    """
+
+    def __radd__(self, other):
+        if all(
+            any(item is other_item for other_item in other_lists)
+            for lists, other_lists in (
+                (self._css_lists, other._css_lists),
+                (self._js_lists, other._js_lists),
+            )
+            for item in lists
+        ):
+            return other
+        return forms.Media.__add__(other, self)
+
+
+_media_cache = {}
+
+
+@receiver(setting_changed)
+def _clear_media_cache(setting, **kwargs):
+    if setting.startswith("SELECT2_"):
+        _media_cache.clear()
+
+
+_option_cache = OrderedDict()
+_option_cache_lock = threading.Lock()
+# The widget whose context is built by a cached render, in this thread.
+_cached_render = threading.local()
+
+
+def _freeze_choices(choices):
+    return tuple(
+        (
+            "" if value is None else str(value),
+            _freeze_choices(label) if isinstance(label, (list, tuple)) else str(label),
+        )
+        for value, label in choices
+    )
 
 
 class Select2Mixin:
@@ -74,6 +146,21 @@ class Select2Mixin:
 
     empty_label = ""
 
+    cache_options = False
+    """
+    Cache the rendered ``<option>`` markup of the widget's choices.
+
+    Rendering thousands of options takes most of the time of a page render.
+    If enabled, the options are rendered once per set of choices and language
+    and the markup is reused by all subsequent renders. Only the selected
+    options are rendered again.
+
+    This is meant for light widgets with large, static choices. The cache
+    size is limited by :attr:`.OPTION_CACHE_SIZE`.
+    """
+
+    option_cache_template_name = "django_select2/select.html"
+
     def build_attrs(self, base_attrs, extra_attrs=None):
         """Add select2 data attributes."""
         default_attrs = {"data-minimum-input-length": 0}
@@ -94,33 +181,122 @@ class Select2Mixin:
 
     def optgroups(self, name, value, attrs=None):
         """Add empty option for clearable selects."""
+        if getattr(_cached_render, "widget", None) is self:
+            # Options are rendered from the cache, see `_render_options`.
+            return []
         if not self.is_required and not self.allow_multiple_selected:
             self.choices = list(chain([("", "")], self.choices))
         return super().optgroups(name, value, attrs=attrs)
 
+    def render(self, name, value, attrs=None, renderer=None):
+        """Render widget with cached options, if :attr:`.cache_options` is set."""
+        if not self.cache_options:
+            return super().render(name, value, attrs=attrs, renderer=renderer)
+        if renderer is None:
+            renderer = get_default_renderer()
+        _cached_render.widget = self
+        try:
+            context = self.get_context(name, value, attrs)
+        finally:
+            _cached_render.widget = None
+        context["widget"]["options"] = self._render_options(
+            name, context["widget"]["value"], renderer
+        )
+        return self._render(self.option_cache_template_name, context, renderer)
+
+    def _get_option_fragments(self, name, choices, renderer):
+        key = (
+            get_language(),
+            self.__class__,
+            self.option_template_name,
+            renderer.__class__,
+            _freeze_choices(choices),
+        )
+        with _option_cache_lock:
+            fragments = _option_cache.get(key)
+            if fragments is not None:
+                _option_cache.move_to_end(key)
+                return fragments
+
+        fragments = []
+        for index, (option_value, option_label) in enumerate(choices):
+            if option_value is None:
+                option_value = ""
+            if isinstance(option_label, (list, tuple)):
+                fragments.append(format_html('<optgroup label="{}">', option_value))
+                for subindex, (subvalue, sublabel) in enumerate(option_label):
+                    option = self.create_option(
+                        name, subvalue, sublabel, False, index, subindex=subindex
+                    )
+                    fragments.append((option, self._render_option(option, renderer)))
+                fragments.append(mark_safe("</optgroup>"))
+            else:
+                option = self.create_option(
+                    name, option_value, option_label, False, index
+                )
+                fragments.append((option, self._render_option(option, renderer)))
+
+        with _option_cache_lock:
+            _option_cache[key] = fragments
+            while len(_option_cache) > settings.SELECT2_OPTION_CACHE_SIZE:
+                _option_cache.popitem(last=False)
+        return fragments
+
+    def _render_option(self, option, renderer):
+        return renderer.render(option["template_name"], {"widget": option})
+
+    def _render_options(self, name, value, renderer):
+        choices = list(self.choices)
+        if not self.is_required and not self.allow_multiple_selected:
+            choices.insert(0, ("", ""))
+        has_selected = False
+        output = []
+        for fragment in self._get_option_fragments(name, choices, renderer):
+            if isinstance(fragment, tuple):
+                option, fragment = fragment
+                if str(option["value"]) in value and (
+                    not has_selected or self.allow_multiple_selected
+                ):
+                    has_selected = True
+                    option = dict(
+                        option,
+                        selected=True,
+                        attrs=dict(option["attrs"], **self.checked_attribute),
+                    )
+                    fragment = self._render_option(option, renderer)
+                # Mimic the whitespace of Django's option template includes.
+                fragment += "\n"
+            output.append("\n  %s" % fragment)
+        return mark_safe("".join(output))
+
     def _get_media(self):
         """
         Construct Media as a dynamic property.
 
+        The media is memoized per language, since it only depends on the
+        active language and the Django-Select2 settings.
+
         .. Note:: For more information visit
             https://docs.djangoproject.com/en/stable/topics/forms/media/#media-as-a-dynamic-property
         """
         lang = get_language()
+        try:
+            return _media_cache[lang]
+        except KeyError:
+            pass
         select2_js = (settings.SELECT2_JS,) if settings.SELECT2_JS else ()
         select2_css = (settings.SELECT2_CSS,) if settings.SELECT2_CSS else ()
 
-        i18n_name = SELECT2_TRANSLATIONS.get(lang)
-        if i18n_name not in settings.SELECT2_I18N_AVAILABLE_LANGUAGES:
-            i18n_name = None
-
+        i18n_name = _get_i18n_name(lang)
         i18n_file = (
             ("%s/%s.js" % (settings.SELECT2_I18N_PATH, i18n_name),) if i18n_name else ()
         )
 
-        return forms.Media(
+        media = _media_cache[lang] = Select2Media(
             js=select2_js + i18n_file + ("django_select2/django_select2.js",),
             css={"screen": select2_css},
         )
+        return media
 
     media = property(_get_media)
 
@@ -240,6 +416,7 @@ class HeavySelect2Mixin:
             "data-ajax--url": self.get_url(),
             "data-ajax--cache": "true",
             "data-ajax--type": "GET",
+            "data-ajax--delay": settings.SELECT2_AJAX_DELAY,
             "data-minimum-input-length": 2,
         }
 
@@ -259,6 +436,10 @@ class HeavySelect2Mixin:
 
     def render(self, *args, **kwargs):
         """Render widget and register it in Django's cache."""
+        if settings.SELECT2_STATELESS_TOKENS:
+            # The registration may replace the field_id, register first.
+            self.set_to_cache()
+            return super().render(*args, **kwargs)
         output = super().render(*args, **kwargs)
         self.set_to_cache()
         return output
@@ -266,6 +447,19 @@ class HeavySelect2Mixin:
     def _get_cache_key(self):
         return "%s%s" % (settings.SELECT2_CACHE_PREFIX, self.uuid)
 
+    def _register(self, value):
+        if settings.SELECT2_STATELESS_TOKENS:
+            token = dumps_token(value)
+            if token is not None:
+                self.field_id = token
+                metrics.increment(
+                    "registry.token", widget=metrics.get_tag(self.__class__)
+                )
+                return
+            self.field_id = signing.dumps(self.uuid)
+        get_registry().set(self._get_cache_key(), value)
+        metrics.increment("registry.write", widget=metrics.get_tag(self.__class__))
+
     def set_to_cache(self):
         """
         Add widget object to Django's cache.
@@ -274,8 +468,8 @@ class HeavySelect2Mixin:
         that is required to serve your JSON response view.
         """
         try:
-            cache.set(self._get_cache_key(), {"widget": self, "url": self.get_url()})
-        except (PicklingError, AttributeError):
+            self._register({"widget": self, "url": self.get_url()})
+        except (pickle.PicklingError, AttributeError):
             msg = 'You need to overwrite "set_to_cache" or ensure that %s is serialisable.'
             raise NotImplementedError(msg % self.__class__.__name__)
 
@@ -332,6 +526,50 @@ class ModelSelect2Mixin:
     max_results = 25
     """Maximal results returned by :class:`.AutoResponseView`."""
 
+    select_related = ()
+    """
+    Related objects selected along with the choices, see :meth:`.optimize_queryset`.
+
+    Example::
+
+        select_related = ['artist']
+
+    """
+
+    prefetch_related = ()
+    """Related objects prefetched for the choices, see :meth:`.optimize_queryset`."""
+
+    only = ()
+    """Fields loaded for the choices, see :meth:`.optimize_queryset`."""
+
+    defer = ()
+    """Fields not loaded for the choices, see :meth:`.optimize_queryset`."""
+
+    using = None
+    """
+    Database alias of the lookups of :class:`.AutoResponseView`.
+
+    Defaults to ``SELECT2_DATABASE`` or the database chosen by the routers.
+    Lookups are read-only, point this to a replica or a search database.
+    """
+
+    selected_using = None
+    """
+    Database alias of the lookup of the selected choices at render time.
+
+    Defaults to the database chosen by the routers. Use the primary database
+    to render choices that were just created.
+    """
+
+    query_timeout = None
+    """
+    Seconds after which the queries of a lookup are canceled.
+
+    Defaults to ``SELECT2_QUERY_TIMEOUT``, ``0`` disables the timeout.
+    """
+
+    _prefetched_choices = None
+
     @property
     def empty_label(self):
         if isinstance(self.choices, ModelChoiceIterator):
@@ -347,12 +585,24 @@ class ModelSelect2Mixin:
             queryset (django.db.models.query.QuerySet): QuerySet to select choices from.
             search_fields (list): List of model lookup strings.
             max_results (int): Max. JsonResponse view page size.
+            select_related (list): Related objects to select along with the choices.
+            prefetch_related (list): Related objects to prefetch for the choices.
+            only (list): Fields to load for the choices.
+            defer (list): Fields not to load for the choices.
+            using (str): Database alias of the lookups.
+            selected_using (str): Database alias of the selected choices.
+            query_timeout (float): Seconds after which lookups are canceled.
 
         """
         self.model = kwargs.pop("model", self.model)
         self.queryset = kwargs.pop("queryset", self.queryset)
         self.search_fields = kwargs.pop("search_fields", self.search_fields)
         self.max_results = kwargs.pop("max_results", self.max_results)
+        for attr in ("select_related", "prefetch_related", "only", "defer"):
+            setattr(self, attr, tuple(kwargs.pop(attr, getattr(self, attr))))
+        self.using = kwargs.pop("using", self.using)
+        self.selected_using = kwargs.pop("selected_using", self.selected_using)
+        self.query_timeout = kwargs.pop("query_timeout", self.query_timeout)
         defaults = {"data_view": "django_select2:auto-json"}
         defaults.update(kwargs)
         super().__init__(*args, **defaults)
@@ -364,8 +614,7 @@ class ModelSelect2Mixin:
         Split the QuerySet, to not pickle the result set.
         """
         queryset = self.get_queryset()
-        cache.set(
-            self._get_cache_key(),
+        self._register(
             {
                 "queryset": [queryset.none(), queryset.query],
                 "cls": self.__class__,
@@ -373,6 +622,12 @@ class ModelSelect2Mixin:
                 "max_results": int(self.max_results),
                 "url": str(self.get_url()),
                 "dependent_fields": dict(self.dependent_fields),
+                "select_related": self.select_related,
+                "prefetch_related": self.prefetch_related,
+                "only": self.only,
+                "defer": self.defer,
+                "using": self.using,
+                "query_timeout": self.query_timeout,
             },
         )
 
@@ -432,6 +687,41 @@ class ModelSelect2Mixin:
             )
         return queryset
 
+    def optimize_queryset(self, queryset):
+        """
+        Apply :attr:`.select_related`, :attr:`.prefetch_related`, :attr:`.only` and :attr:`.defer`.
+
+        The optimizations are applied to both the QuerySet of
+        :class:`.AutoResponseView` and the lookup of the selected choices.
+        Use them, if :meth:`.label_from_instance` accesses related objects.
+
+        Example::
+
+            class AlbumWidget(ModelSelect2Widget):
+                search_fields = ['title__icontains']
+                select_related = ['artist']
+                only = ['title', 'artist__title']
+
+                def label_from_instance(self, obj):
+                    return '%s — %s' % (obj.title, obj.artist.title)
+
+        Args:
+            queryset (django.db.models.query.QuerySet): QuerySet to optimize.
+
+        Returns:
+            QuerySet: Optimized QuerySet
+
+        """
+        if self.select_related:
+            queryset = queryset.select_related(*self.select_related)
+        if self.prefetch_related:
+            queryset = queryset.prefetch_related(*self.prefetch_related)
+        if self.only:
+            queryset = queryset.only(*self.only)
+        if self.defer:
+            queryset = queryset.defer(*self.defer)
+        return queryset
+
     def get_search_fields(self):
         """Return list of lookup names."""
         if self.search_fields:
@@ -454,8 +744,7 @@ class ModelSelect2Mixin:
             c for c in selected_choices if c not in self.choices.field.empty_values
         }
         field_name = self.choices.field.to_field_name or "pk"
-        query = Q(**{"%s__in" % field_name: selected_choices})
-        for obj in self.choices.queryset.filter(query):
+        for obj in self._get_selected_instances(field_name, selected_choices):
             option_value = self.choices.choice(obj)[0]
             option_label = self.label_from_instance(obj)
 
@@ -473,6 +762,24 @@ class ModelSelect2Mixin:
             )
         return groups
 
+    def _get_selected_instances(self, field_name, selected_choices):
+        if not selected_choices:
+            return []
+        if self._prefetched_choices is not None:
+            requested, instances = self._prefetched_choices
+            if selected_choices <= requested:
+                return [
+                    obj for key, obj in instances.items() if key in selected_choices
+                ]
+        query = Q(**{"%s__in" % field_name: selected_choices})
+        return self._get_selected_queryset().filter(query)
+
+    def _get_selected_queryset(self):
+        queryset = self.optimize_queryset(self.choices.queryset)
+        if self.selected_using:
+            queryset = queryset.using(self.selected_using)
+        return queryset
+
     def label_from_instance(self, obj):
         """
         Return option label representation from instance.
@@ -539,11 +846,148 @@ class ModelSelect2MultipleWidget(ModelSelect2Mixin, HeavySelect2MultipleWidget):
     """
 
 
+class ModelSelect2LazyMultipleWidget(ModelSelect2MultipleWidget):
+    """
+    Select2 model multiple select widget for very large selections.
+
+    Only the keys of the selected values are rendered, without querying
+    the database. The JavaScript fetches their labels from
+    :class:`.AutoResponseView` in batches of :attr:`.label_batch_size`,
+    as the user scrolls through the selection.
+
+    Use it with :class:`.ModelSelect2LazyMultipleField`::
+
+        class PlaylistForm(forms.Form):
+            songs = ModelSelect2LazyMultipleField(
+                queryset=Song.objects.all(),
+                widget=ModelSelect2LazyMultipleWidget(
+                    search_fields=['title__icontains']
+                ),
+            )
+
+    """
+
+    label_batch_size = 100
+    """Number of labels fetched per request."""
+
+    to_field_name = None
+    """
+    Field of the selected values, defaults to the field's ``to_field_name``.
+
+    The labels are looked up by this field or by primary key.
+    """
+
+    def __init__(self, *args, **kwargs):
+        """
+        Overwrite class parameters if passed as keyword arguments.
+
+        Args:
+            to_field_name (str): Field of the selected values.
+
+        """
+        self.to_field_name = kwargs.pop("to_field_name", self.to_field_name)
+        super().__init__(*args, **kwargs)
+
+    def get_to_field_name(self):
+        """Return the field of the selected values, ``None`` for the primary key."""
+        if self.to_field_name is None and isinstance(self.choices, ModelChoiceIterator):
+            return self.choices.field.to_field_name
+        return self.to_field_name
+
+    def _register(self, value):
+        value["to_field_name"] = self.get_to_field_name()
+        super()._register(value)
+
+    def build_attrs(self, base_attrs, extra_attrs=None):
+        """Add the attributes of the lazy labels."""
+        default_attrs = {
+            "data-lazy-labels": "true",
+            "data-label-batch-size": self.label_batch_size,
+        }
+        default_attrs.update(base_attrs)
+        return super().build_attrs(default_attrs, extra_attrs=extra_attrs)
+
+    def optgroups(self, name, value, attrs=None):
+        """Return the selected values as options labeled by their keys."""
+        options = [
+            self.create_option(name, v, v, True, index)
+            for index, v in enumerate(v for v in value if v != "")
+        ]
+        return [(None, options, 0)]
+
+
+class ModelSelect2LazyMultipleField(forms.ModelMultipleChoiceField):
+    """
+    Model multiple choice field for very large selections.
+
+    :class:`~django.forms.ModelMultipleChoiceField` validates all selected
+    values in a single query, whose ``IN`` clause may exceed the database's
+    limit of query parameters. This field validates them in chunks of
+    :attr:`.chunk_size` and cleans to a list of instances.
+    """
+
+    widget = ModelSelect2LazyMultipleWidget
+
+    chunk_size = 500
+    """Number of values validated per query."""
+
+    def __init__(self, queryset, **kwargs):
+        """
+        Overwrite class parameters if passed as keyword arguments.
+
+        Args:
+            chunk_size (int): Number of values validated per query.
+
+        """
+        self.chunk_size = kwargs.pop("chunk_size", self.chunk_size)
+        super().__init__(queryset, **kwargs)
+
+    def _check_values(self, value):
+        key = self.to_field_name or "pk"
+        model = self.queryset.model
+        key_field = model._meta.pk if key == "pk" else model._meta.get_field(key)
+        value = list(OrderedDict.fromkeys(value))
+        for pk in value:
+            try:
+                key_field.get_prep_value(pk)
+            except (ValueError, TypeError, ValidationError):
+                raise ValidationError(
+                    self.error_messages["invalid_pk_value"],
+                    code="invalid_pk_value",
+                    params={"pk": pk},
+                )
+        instances = []
+        keys = set()
+        for start in range(0, len(value), self.chunk_size):
+            chunk = value[start : start + self.chunk_size]
+            for obj in self.queryset.filter(**{"%s__in" % key: chunk}):
+                instances.append(obj)
+                keys.add(str(getattr(obj, key)))
+        for val in value:
+            if str(val) not in keys:
+                raise ValidationError(
+                    self.error_messages["invalid_choice"],
+                    code="invalid_choice",
+                    params={"value": val},
+                )
+        return instances
+
+
 class ModelSelect2TagWidget(ModelSelect2Mixin, HeavySelect2TagWidget):
     """
     Select2 model widget with tag support.
 
-    This it not a simple drop in widget.
+    Set :attr:`.natural_key_field` to look up submitted values, that are not
+    primary keys, by this field and to create the missing objects.
+
+    Example::
+
+        class GenreSelect2TagWidget(ModelSelect2TagWidget):
+            queryset = Genre.objects.all()
+            search_fields = ['title__icontains']
+            natural_key_field = 'title'
+
+    Otherwise, this is not a simple drop in widget.
     It requires to implement you own :func:`.value_from_datadict`
     that adds missing tags to you QuerySet.
 
@@ -565,3 +1009,213 @@ class ModelSelect2TagWidget(ModelSelect2Mixin, HeavySelect2TagWidget):
                 return cleaned_values
 
     """
+
+    natural_key_field = None
+    """
+    Model field that identifies tags, which are not primary keys.
+
+    Example::
+
+        natural_key_field = 'title'
+
+    """
+
+    def __init__(self, *args, **kwargs):
+        """
+        Overwrite class parameters if passed as keyword arguments.
+
+        Args:
+            natural_key_field (str): Model field that identifies new tags.
+
+        """
+        self.natural_key_field = kwargs.pop("natural_key_field", self.natural_key_field)
+        super().__init__(*args, **kwargs)
+
+    def value_from_datadict(self, data, files, name):
+        """
+        Return the keys of the submitted tags, see :meth:`.resolve_tags`.
+
+        Django reads the value several times per submission, e.g. to clean
+        the form and to detect changes. The tags are resolved only once per
+        submitted data.
+        """
+        values = super().value_from_datadict(data, files, name)
+        if not self.natural_key_field:
+            return values
+        submitted = (name, tuple(values))
+        resolved = getattr(self, "_resolved_tags", None)
+        if resolved is None or resolved[0] is not data or resolved[1] != submitted:
+            resolved = self._resolved_tags = (
+                data,
+                submitted,
+                self.resolve_tags(values),
+            )
+        return list(resolved[2])
+
+    def resolve_tags(self, values):
+        """
+        Return the keys of the tags ``values`` and create the missing ones.
+
+        Values are looked up by key and by :attr:`.natural_key_field` in one
+        query each. The missing tags are created in a single bulk insert.
+        All of this happens inside one transaction.
+
+        Args:
+            values (list): Keys or natural keys of the submitted tags.
+
+        Returns:
+            list: Keys of the tags in the order of ``values``.
+
+        """
+        queryset = self.get_queryset()
+        model = queryset.model
+        to_field_name = "pk"
+        if isinstance(self.choices, ModelChoiceIterator):
+            to_field_name = self.choices.field.to_field_name or "pk"
+        key_field = (
+            model._meta.pk
+            if to_field_name == "pk"
+            else model._meta.get_field(to_field_name)
+        )
+        values = list(
+            OrderedDict.fromkeys(str(v) for v in values if v not in ("", None))
+        )
+        keys = {}
+        for value in values:
+            try:
+                keys[value] = key_field.to_python(value)
+            except ValidationError:
+                pass
+
+        using = queryset._db or router.db_for_write(model)
+        queryset = queryset.using(using)
+        resolved = {}
+        with transaction.atomic(using=using):
+            if keys:
+                existing = {
+                    str(key)
+                    for key in queryset.filter(
+                        **{"%s__in" % to_field_name: set(keys.values())}
+                    ).values_list(to_field_name, flat=True)
+                }
+                resolved.update(
+                    (value, value)
+                    for value, key in keys.items()
+                    if str(key) in existing
+                )
+            missing = [value for value in values if value not in resolved]
+            if missing:
+                resolved.update(
+                    self._get_natural_keys(queryset, to_field_name, missing)
+                )
+            missing = [value for value in missing if value not in resolved]
+            if missing:
+                queryset.bulk_create(
+                    [self.build_tag(value) for value in missing],
+                    ignore_conflicts=connections[
+                        using
+                    ].features.supports_ignore_conflicts,
+                )
+                resolved.update(
+                    self._get_natural_keys(queryset, to_field_name, missing)
+                )
+        return [resolved[value] for value in values if value in resolved]
+
+    def _get_natural_keys(self, queryset, to_field_name, values):
+        return {
+            str(natural_key): str(key)
+            for natural_key, key in queryset.filter(
+                **{"%s__in" % self.natural_key_field: values}
+            ).values_list(self.natural_key_field, to_field_name)
+        }
+
+    def build_tag(self, value):
+        """
+        Return an unsaved instance of the new tag ``value``.
+
+        Override this method, to populate further fields of new tags.
+
+        Args:
+            value (str): Natural key of the new tag.
+
+        Returns:
+            django.db.models.Model: Unsaved instance.
+
+        """
+        return self.get_queryset().model(**{self.natural_key_field: value})
+
+
+def _iter_forms(forms):
+    for form in forms:
+        if hasattr(form, "forms"):
+            yield from form.forms
+        else:
+            yield form
+
+
+def prefetch_selected_choices(*forms):
+    """
+    Resolve the selected options of all model widgets in one query per QuerySet.
+
+    By default every model widget runs its own query at render time to
+    look up the labels of its selected values. For a formset with many
+    rows this quickly adds up. This function collects the selected values
+    of all model widgets in the given forms and formsets, groups them by
+    QuerySet and resolves each group with a single query.
+
+    Example::
+
+        formset = AlbumFormSet(queryset=Album.objects.all())
+        prefetch_selected_choices(formset)
+
+    Widgets whose selection changes after the prefetch fall back to their
+    own query.
+
+    Args:
+        *forms: Forms or formsets that are about to be rendered.
+
+    """
+    groups = {}
+    for form in _iter_forms(forms):
+        for bound_field in form:
+            widget = bound_field.field.widget
+            if not isinstance(widget, ModelSelect2Mixin) or not isinstance(
+                widget.choices, ModelChoiceIterator
+            ):
+                continue
+            if isinstance(widget, ModelSelect2LazyMultipleWidget):
+                # Lazy widgets render their keys and load the labels later.
+                continue
+            field = widget.choices.field
+            queryset = widget._get_selected_queryset()
+            try:
+                sql = str(queryset.query)
+            except EmptyResultSet:
+                continue
+            field_name = field.to_field_name or "pk"
+            group = groups.setdefault(
+                (
+                    queryset.model,
+                    queryset.db,
+                    sql,
+                    field_name,
+                    tuple(map(str, queryset._prefetch_related_lookups)),
+                ),
+                (queryset, field, set(), []),
+            )
+            group[2].update(
+                str(v)
+                for v in widget.format_value(bound_field.value())
+                if v not in field.empty_values
+            )
+            group[3].append(widget)
+
+    for (_, _, _, field_name, _), (queryset, field, values, widgets) in groups.items():
+        instances = {}
+        if values:
+            query = Q(**{"%s__in" % field_name: values})
+            instances = {
+                str(field.prepare_value(obj)): obj for obj in queryset.filter(query)
+            }
+        for widget in widgets:
+            widget._prefetched_choices = (values, instances)
@@ -0,0 +1,218 @@
+"""Inspect and purge the widgets registered for the JSON response view."""
+import json
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...conf import settings
+from ...registry import BaseRegistry, get_registry
+
+SIZE_BUCKETS = [1024, 4 * 1024, 16 * 1024, 64 * 1024, 256 * 1024]
+TTL_BUCKETS = [60, 5 * 60, 60 * 60, 24 * 60 * 60]
+
+
+def _bucket(value, buckets, unit):
+    for bound in buckets:
+        if value < bound:
+            return "< %d%s" % (bound, unit)
+    return ">= %d%s" % (buckets[-1], unit)
+
+
+def _ttl_bucket(ttl):
+    if ttl is None:
+        return "no expiry"
+    if ttl <= 0:
+        return "expired"
+    return _bucket(ttl, TTL_BUCKETS, "s")
+
+
+def _summary(values):
+    if not values:
+        return None
+    return {
+        "min": min(values),
+        "median": statistics.median(values),
+        "max": max(values),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Inspect and purge the widgets registered in SELECT2_REGISTRY_BACKEND. "
+        "Widgets in local memory caches are only visible to the process "
+        "that registered them."
+    )
+
+    def add_arguments(self, parser):
+        subparsers = parser.add_subparsers(dest="action")
+        subparsers.required = True
+
+        inspect = subparsers.add_parser(
+            "inspect", help="Report the number and sizes of registered widgets."
+        )
+        inspect.add_argument(
+            "--oversized",
+            type=int,
+            metavar="BYTES",
+            help="Flag entries larger than BYTES "
+            "[default: SELECT2_REGISTRY_MAX_SIZE or 65536].",
+        )
+        inspect.add_argument(
+            "--json", action="store_true", help="Print the report as JSON."
+        )
+
+        purge = subparsers.add_parser("purge", help="Delete registered widgets.")
+        purge.add_argument(
+            "--widget",
+            action="append",
+            default=[],
+            help="Delete widgets of this class, e.g. myapp.forms.MyWidget.",
+        )
+        purge.add_argument(
+            "--older-than",
+            type=int,
+            metavar="SECONDS",
+            help="Delete widgets registered more than SECONDS ago.",
+        )
+        purge.add_argument(
+            "--expired", action="store_true", help="Delete expired widgets."
+        )
+        purge.add_argument("--all", action="store_true", help="Delete all widgets.")
+        purge.add_argument("--batch-size", type=int, default=1000)
+        purge.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report the number of widgets, without deleting them.",
+        )
+
+    def handle(self, *args, action, **options):
+        registry = get_registry()
+        try:
+            if action == "inspect":
+                self.inspect(registry.scan(), **options)
+            else:
+                self.purge(registry, **options)
+        except NotImplementedError as e:
+            raise CommandError(e)
+
+    def inspect(self, entries, oversized, **options):
+        if oversized is None:
+            oversized = settings.SELECT2_REGISTRY_MAX_SIZE or 64 * 1024
+        now = time.time()
+        total = {"entries": 0, "bytes": 0}
+        widgets = {}
+        sizes = {}
+        ttls = {}
+        flagged = []
+        for entry in entries:
+            ttl = None if entry.expires is None else entry.expires - now
+            total["entries"] += 1
+            total["bytes"] += entry.size
+            widget = widgets.setdefault(
+                entry.widget or "unknown", {"sizes": [], "ttls": []}
+            )
+            widget["sizes"].append(entry.size)
+            if ttl is not None:
+                widget["ttls"].append(ttl)
+            size_bucket = _bucket(entry.size, SIZE_BUCKETS, "B")
+            sizes[size_bucket] = sizes.get(size_bucket, 0) + 1
+            ttl_bucket = _ttl_bucket(ttl)
+            ttls[ttl_bucket] = ttls.get(ttl_bucket, 0) + 1
+            if entry.size > oversized:
+                flagged.append(
+                    {"key": entry.key, "widget": entry.widget, "size": entry.size}
+                )
+
+        report = {
+            **total,
+            "widgets": {
+                name: {
+                    "entries": len(data["sizes"]),
+                    "bytes": sum(data["sizes"]),
+                    "size": _summary(data["sizes"]),
+                    "ttl": _summary(data["ttls"]),
+                }
+                for name, data in sorted(widgets.items())
+            },
+            "sizes": sizes,
+            "ttls": ttls,
+            "oversized": sorted(flagged, key=lambda e: -e["size"]),
+        }
+        if options["json"]:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        self.stdout.write(
+            "%(entries)d entries, %(bytes)d bytes" % report, self.style.SUCCESS
+        )
+        for name, data in report["widgets"].items():
+            self.stdout.write(
+                "%s: %d entries, %d bytes, %s"
+                % (
+                    name,
+                    data["entries"],
+                    data["bytes"],
+                    "size %(min)d/%(median)d/%(max)d B" % data["size"],
+                )
+                + (
+                    ", TTL %(min)d/%(median)d/%(max)d s" % data["ttl"]
+                    if data["ttl"]
+                    else ""
+                )
+            )
+        self.stdout.write("Sizes:")
+        for bucket, count in sizes.items():
+            self.stdout.write("  %s: %d" % (bucket, count))
+        self.stdout.write("TTLs:")
+        for bucket, count in ttls.items():
+            self.stdout.write("  %s: %d" % (bucket, count))
+        for entry in report["oversized"]:
+            self.stdout.write(
+                "Oversized: %(key)s (%(widget)s) %(size)d bytes" % entry,
+                self.style.WARNING,
+            )
+
+    def purge(self, registry, widget, older_than, expired, **options):
+        if not (widget or older_than is not None or expired or options["all"]):
+            raise CommandError("Pass --widget, --older-than, --expired or --all.")
+        if older_than is not None and not registry.timeout:
+            raise CommandError(
+                "The age of widgets is unknown, since the registry has no timeout."
+            )
+        if (
+            expired
+            and not (widget or older_than is not None or options["all"])
+            and not options["dry_run"]
+            and type(registry).purge is not BaseRegistry.purge
+        ):
+            # The registry deletes expired widgets without loading them.
+            self.stdout.write(
+                "Deleted %d entries." % registry.purge(), self.style.SUCCESS
+            )
+            return
+        now = time.time()
+
+        def matches(entry):
+            if widget and entry.widget not in widget:
+                return False
+            if expired and (entry.expires is None or entry.expires > now):
+                return False
+            if older_than is not None and (
+                entry.expires is None
+                or now - (entry.expires - registry.timeout) < older_than
+            ):
+                return False
+            return True
+
+        # Collect the keys first, to not delete entries while scanning.
+        keys = [entry.key for entry in registry.scan() if matches(entry)]
+        batch_size = options["batch_size"]
+        if not options["dry_run"]:
+            for i in range(0, len(keys), batch_size):
+                registry.delete(keys[i : i + batch_size])
+        self.stdout.write(
+            "%s %d entries."
+            % ("Would delete" if options["dry_run"] else "Deleted", len(keys)),
+            self.style.SUCCESS,
+        )
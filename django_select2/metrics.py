@@ -0,0 +1,172 @@
+"""
+Metrics about the widget registry and lookups.
+
+Django-Select2 counts registry writes, hits and misses as well as lookups,
+their result counts and latencies. The metrics are reported to the
+collector defined in the setting ``SELECT2_METRICS_COLLECTOR``
+[default=``django_select2.metrics.InMemoryCollector``].
+
+To export the metrics to your monitoring stack, implement an adapter::
+
+    from django_select2.metrics import BaseCollector
+
+    class StatsdCollector(BaseCollector):
+        def increment(self, name, value=1, **tags):
+            statsd.incr("select2.%s" % name, value, tags=tags)
+
+        def observe(self, name, value, **tags):
+            statsd.histogram("select2.%s" % name, value, tags=tags)
+
+and point the ``SELECT2_METRICS_COLLECTOR`` setting to it.
+
+The following metrics are reported:
+
+``registry.write`` and ``registry.write_bytes``
+    Widgets registered and the size of their pickled registry entries.
+    The size is only measured if ``SELECT2_REGISTRY_COMPRESS_THRESHOLD``
+    or ``SELECT2_REGISTRY_MAX_SIZE`` is set, to not pickle every widget twice.
+``registry.compression_ratio``
+    Uncompressed divided by compressed size of compressed registry entries,
+    see ``SELECT2_REGISTRY_COMPRESS_THRESHOLD``.
+``registry.spec_write`` and ``registry.spec_hit``
+    Widget specs stored or found already registered,
+    see ``SELECT2_REGISTRY_DEDUPLICATE``.
+``registry.token``
+    Widgets encoded into their ``field_id`` instead of being registered,
+    see ``SELECT2_STATELESS_TOKENS``.
+``registry.hit`` and ``registry.miss``
+    Registry lookups that found a widget or responded with a 404,
+    e.g. because the entry expired.
+``registry.invalid_signature`` and ``registry.url_mismatch``
+    Lookups with a forged ``field_id`` or a ``field_id`` issued for another view.
+``lookup``, ``lookup.results`` and ``lookup.latency``
+    Lookups, their number of results and their duration in seconds.
+``lookup.timeout``
+    Lookups canceled by their statement timeout, see ``SELECT2_QUERY_TIMEOUT``.
+
+All metrics are tagged with the ``widget`` class, if it is known.
+"""
+import bisect
+import threading
+
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from .conf import settings
+
+__all__ = (
+    "BaseCollector",
+    "InMemoryCollector",
+    "get_collector",
+    "increment",
+    "observe",
+)
+
+
+class BaseCollector:
+    """Interface for metric collectors."""
+
+    def increment(self, name, value=1, **tags):
+        """Increment the counter ``name`` by ``value``."""
+        raise NotImplementedError
+
+    def observe(self, name, value, **tags):
+        """Add ``value`` to the histogram ``name``."""
+        raise NotImplementedError
+
+
+class InMemoryCollector(BaseCollector):
+    """
+    Collect metrics in the memory of the current process.
+
+    Example::
+
+        >>> collector = InMemoryCollector()
+        >>> collector.increment("lookup", widget="MyWidget")
+        >>> collector.observe("lookup.latency", 0.02, widget="MyWidget")
+        >>> collector.counters[("lookup", (("widget", "MyWidget"),))]
+        1
+        >>> collector.histograms[("lookup.latency", (("widget", "MyWidget"),))]["count"]
+        1
+
+    """
+
+    buckets = {
+        "registry.write_bytes": (256, 1024, 4096, 16384, 65536, 262144, 1048576),
+        "registry.compression_ratio": (1, 1.5, 2, 3, 5, 10, 20),
+        "lookup.results": (0, 1, 5, 10, 25, 50, 100, 500),
+    }
+    """Upper bounds of the histogram buckets by metric name."""
+
+    default_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+    """Upper bounds of the histogram buckets of all other metrics, e.g. latencies."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    def increment(self, name, value=1, **tags):
+        key = (name, tuple(sorted(tags.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **tags):
+        key = (name, tuple(sorted(tags.items())))
+        buckets = self.buckets.get(name, self.default_buckets)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {
+                    "count": 0,
+                    "sum": 0,
+                    "buckets": dict.fromkeys(buckets + (float("inf"),), 0),
+                }
+            histogram["count"] += 1
+            histogram["sum"] += value
+            bound = (buckets + (float("inf"),))[bisect.bisect_left(buckets, value)]
+            histogram["buckets"][bound] += 1
+
+    def reset(self):
+        """Remove all collected metrics."""
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+
+_collector = None
+
+
+def get_collector():
+    """Return the collector defined in ``SELECT2_METRICS_COLLECTOR`` or ``None``."""
+    global _collector
+    if _collector is None and settings.SELECT2_METRICS_COLLECTOR:
+        _collector = import_string(settings.SELECT2_METRICS_COLLECTOR)()
+    return _collector
+
+
+@receiver(setting_changed)
+def _reset_collector(setting, **kwargs):
+    global _collector
+    if setting == "SELECT2_METRICS_COLLECTOR":
+        _collector = None
+
+
+def get_tag(cls):
+    """Return tag value for a widget class."""
+    return "%s.%s" % (cls.__module__, cls.__qualname__)
+
+
+def increment(name, value=1, **tags):
+    """Increment the counter ``name`` of the configured collector."""
+    collector = get_collector()
+    if collector is not None:
+        collector.increment(name, value, **tags)
+
+
+def observe(name, value, **tags):
+    """Add ``value`` to the histogram ``name`` of the configured collector."""
+    collector = get_collector()
+    if collector is not None:
+        collector.observe(name, value, **tags)
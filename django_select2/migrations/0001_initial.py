@@ -0,0 +1,28 @@
+# Generated by Django 3.1.14 on 2026-10-19 05:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = []
+
+    operations = [
+        migrations.CreateModel(
+            name="WidgetRegistration",
+            fields=[
+                (
+                    "key",
+                    models.CharField(max_length=255, primary_key=True, serialize=False),
+                ),
+                ("value", models.BinaryField()),
+                ("expires", models.DateTimeField(db_index=True)),
+            ],
+            options={
+                "verbose_name": "widget registration",
+                "verbose_name_plural": "widget registrations",
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+"""Models of Django-Select2."""
+from django.db import models
+
+
+class WidgetRegistration(models.Model):
+    """Widget registered in the :class:`.DatabaseRegistry`."""
+
+    key = models.CharField(max_length=255, primary_key=True)
+    value = models.BinaryField()
+    expires = models.DateTimeField(db_index=True)
+
+    class Meta:
+        verbose_name = "widget registration"
+        verbose_name_plural = "widget registrations"
+
+    def __str__(self):
+        return self.key
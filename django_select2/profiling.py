@@ -0,0 +1,203 @@
+"""
+Sampled profiling of autocomplete requests.
+
+Slow lookups often depend on the production data distribution. Set
+``SELECT2_PROFILE_RATE`` to profile one in N requests of
+:class:`.AutoResponseView`::
+
+    SELECT2_PROFILE_RATE = 1000
+    SELECT2_PROFILE_DIR = "/var/tmp/select2-profiles"
+
+Each sampled request is run with :mod:`cProfile` and the SQL queries it
+executes are recorded. The results are written to a subdirectory of
+``SELECT2_PROFILE_DIR`` per widget class: a ``.prof`` file with the
+profiler's stats and a ``.json`` file with the request and its queries.
+Requests that are not sampled only increment a counter.
+
+Use :func:`aggregate` to analyse the profiles offline::
+
+    from django_select2.profiling import aggregate
+
+    for widget, profile in aggregate("/var/tmp/select2-profiles").items():
+        print(widget, profile["requests"])
+        profile["stats"].sort_stats("cumulative").print_stats(20)
+"""
+import itertools
+import json
+import logging
+import os
+import tempfile
+import time
+import uuid
+from contextlib import ExitStack
+
+from django.core.signals import setting_changed
+from django.db import connections
+from django.dispatch import receiver
+
+from . import metrics
+from .conf import settings
+
+logger = logging.getLogger(__name__)
+
+_counter = itertools.count()
+
+
+@receiver(setting_changed)
+def _reset_counter(setting, **kwargs):
+    global _counter
+    if setting == "SELECT2_PROFILE_RATE":
+        _counter = itertools.count()
+
+
+def get_profile_dir():
+    """Return the directory profiles are written to."""
+    return settings.SELECT2_PROFILE_DIR or os.path.join(
+        tempfile.gettempdir(), "django_select2_profiles"
+    )
+
+
+class _NotSampled:
+    def __enter__(self):
+        return None
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+NOT_SAMPLED = _NotSampled()
+
+
+class Profile:
+    """Context manager profiling a request of an :class:`.AutoResponseView`."""
+
+    def __init__(self, view):
+        import cProfile
+
+        self.view = view
+        self.queries = []
+        self.profiler = cProfile.Profile()
+        self._stack = ExitStack()
+
+    def record_query(self, alias):
+        def execute_wrapper(execute, sql, params, many, context):
+            start = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                self.queries.append(
+                    {
+                        "alias": alias,
+                        "sql": sql,
+                        "duration": time.perf_counter() - start,
+                    }
+                )
+
+        return execute_wrapper
+
+    def __enter__(self):
+        for alias in connections:
+            self._stack.enter_context(
+                connections[alias].execute_wrapper(self.record_query(alias))
+            )
+        self.start = time.perf_counter()
+        try:
+            self.profiler.enable()
+        except ValueError:
+            # Another profiler is active, e.g. in a concurrent request.
+            self.profiler = None
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.profiler is not None:
+            self.profiler.disable()
+        self.duration = time.perf_counter() - self.start
+        self._stack.close()
+        if self.profiler is not None:
+            try:
+                self.dump(exc_type)
+            except Exception:
+                # Never fail the request or mask its exception.
+                logger.exception("Could not write the profile of a request.")
+        return False
+
+    def dump(self, exc_type=None):
+        """Write the stats and the queries to :func:`get_profile_dir`."""
+        # Lookups that waited for an identical one only know the widget class.
+        widget_class = getattr(self.view, "widget_class", None)
+        tag = metrics.get_tag(widget_class) if widget_class is not None else "unknown"
+        directory = os.path.join(get_profile_dir(), tag)
+        os.makedirs(directory, exist_ok=True)
+        name = "%d-%s" % (time.time() * 1000, uuid.uuid4().hex[:8])
+        request = self.view.request
+        with open(os.path.join(directory, name + ".json"), "w") as f:
+            json.dump(
+                {
+                    "path": request.path,
+                    "query_string": request.META.get("QUERY_STRING", ""),
+                    "duration": self.duration,
+                    "error": exc_type.__name__ if exc_type else None,
+                    "queries": self.queries,
+                },
+                f,
+            )
+        self.profiler.dump_stats(os.path.join(directory, name + ".prof"))
+
+
+def sample(view):
+    """
+    Return a context manager profiling the request, if it is sampled.
+
+    Args:
+        view (AutoResponseView): View handling the request.
+
+    Returns:
+        Profile: Context manager profiling the request or a no-op context
+        manager, if the request is not sampled.
+
+    """
+    rate = settings.SELECT2_PROFILE_RATE
+    if not rate or next(_counter) % rate:
+        return NOT_SAMPLED
+    return Profile(view)
+
+
+def aggregate(directory=None):
+    """
+    Aggregate the profiles written to ``directory`` per widget class.
+
+    Args:
+        directory (str): Profile directory, defaults to :func:`get_profile_dir`.
+
+    Returns:
+        dict: Per widget class, the number of ``requests``, the combined
+        :class:`pstats.Stats` as ``stats`` and the ``queries`` with their
+        ``count`` and total ``duration`` by SQL.
+
+    """
+    import pstats
+
+    directory = directory or get_profile_dir()
+    profiles = {}
+    for tag in sorted(os.listdir(directory)):
+        path = os.path.join(directory, tag)
+        names = sorted(
+            name[: -len(".prof")] for name in os.listdir(path) if name.endswith(".prof")
+        )
+        if not names:
+            continue
+        queries = {}
+        for name in names:
+            with open(os.path.join(path, name + ".json")) as f:
+                for query in json.load(f)["queries"]:
+                    summary = queries.setdefault(
+                        query["sql"], {"count": 0, "duration": 0}
+                    )
+                    summary["count"] += 1
+                    summary["duration"] += query["duration"]
+        profiles[tag] = {
+            "requests": len(names),
+            "stats": pstats.Stats(*(os.path.join(path, n + ".prof") for n in names)),
+            "queries": queries,
+        }
+    return profiles
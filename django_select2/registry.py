@@ -0,0 +1,646 @@
+"""
+Storage of the widgets registered for :class:`.AutoResponseView`.
+
+Heavy widgets register the information required to serve their lookups,
+when they are rendered. The view looks them up by their ``field_id``. The
+registry is defined in the setting ``SELECT2_REGISTRY_BACKEND``
+[default=``django_select2.registry.CacheRegistry``].
+
+:class:`.CacheRegistry` stores the widgets in the cache backend, see
+:mod:`django_select2.cache`.
+
+:class:`.DatabaseRegistry` stores the widgets in a dedicated table, looked
+up by primary key, with an indexed expiry. It is an alternative to Django's
+``DatabaseCache`` for deployments without a cache server, whose culling
+scans the whole table. Enable it and create its table with ``migrate``::
+
+    SELECT2_REGISTRY_BACKEND = "django_select2.registry.DatabaseRegistry"
+
+Expired widgets are deleted in batches by :meth:`.DatabaseRegistry.purge`,
+which should be called periodically.
+
+The ``select2_registry`` management command reports the number and sizes
+of the registered widgets by widget class and TTL and deletes widgets by
+class or age::
+
+    python manage.py select2_registry inspect --oversized 65536
+    python manage.py select2_registry purge --widget myapp.forms.MyWidget
+    python manage.py select2_registry purge --older-than 3600
+
+Widgets can be scanned in the :class:`.DatabaseRegistry` and in local memory,
+file based, database and django-redis cache backends.
+
+If ``SELECT2_STATELESS_TOKENS`` is enabled, simple model widgets are not
+stored at all. Their ``field_id`` is a signed JSON token of the widget
+instead, see :func:`dumps_token`. Widgets with filtered QuerySets, that
+can't be represented as JSON or whose token exceeds
+``SELECT2_STATELESS_TOKEN_MAX_SIZE`` are stored in the registry.
+"""
+import base64
+import datetime
+import glob
+import hashlib
+import logging
+import os
+import pickle  # nosec
+import threading
+import time
+import zlib
+from collections import OrderedDict, namedtuple
+
+from django.apps import apps
+from django.core import signing
+from django.core.exceptions import EmptyResultSet
+from django.core.signals import setting_changed
+from django.db import IntegrityError, connections, models, router, transaction
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from . import metrics
+from .cache import cache
+from .conf import settings
+
+__all__ = (
+    "BaseRegistry",
+    "CacheRegistry",
+    "DatabaseRegistry",
+    "Registration",
+    "RegistryPayloadTooLarge",
+    "SpecPointer",
+    "dumps_token",
+    "get_registry",
+    "is_token",
+    "loads_token",
+)
+
+logger = logging.getLogger(__name__)
+
+_registry = None
+
+SpecPointer = namedtuple("SpecPointer", ["key", "widget"])
+SpecPointer.__doc__ = (
+    "Reference to a deduplicated widget spec, see :class:`BaseRegistry`."
+)
+
+Registration = namedtuple("Registration", ["key", "widget", "size", "expires"])
+Registration.__doc__ = """
+Widget found by :meth:`.BaseRegistry.scan`.
+
+``widget`` is the import path of the widget class or ``None``, if the entry
+can't be unpickled. ``size`` is the size of the pickled entry in bytes and
+``expires`` the expiry as a UNIX timestamp or ``None``, if it doesn't expire.
+"""
+
+
+class RegistryPayloadTooLarge(ValueError):
+    """The pickled widget exceeds ``SELECT2_REGISTRY_MAX_SIZE``."""
+
+
+Compressed = namedtuple("Compressed", ["algorithm", "data"])
+Compressed.__doc__ = "Compressed pickle of a widget, see :func:`encode`."
+
+
+def _compressor(algorithm):
+    if algorithm == "zlib":
+        return zlib
+    if algorithm == "lzma":
+        import lzma
+
+        return lzma
+    raise ValueError("Unsupported compression: %r" % algorithm)
+
+
+def _widget(value):
+    if isinstance(value, SpecPointer):
+        return value.widget
+    try:
+        cls = value["cls"] if "cls" in value else value["widget"].__class__
+    except (TypeError, KeyError, AttributeError):
+        return None
+    return metrics.get_tag(cls)
+
+
+def _deduplicable(value):
+    # Widgets pickled as a whole contain their uuid, their specs are unique.
+    return isinstance(value, dict) and "widget" not in value
+
+
+def encode(value):
+    """
+    Return the payload stored in the registry for a widget.
+
+    Widgets whose pickle is larger than ``SELECT2_REGISTRY_COMPRESS_THRESHOLD``
+    are compressed with ``SELECT2_REGISTRY_COMPRESSION``. Widgets larger than
+    ``SELECT2_REGISTRY_MAX_SIZE`` after compression are rejected or logged,
+    depending on ``SELECT2_REGISTRY_MAX_SIZE_ACTION``. The widget is only
+    pickled here if either setting is enabled.
+
+    Raises:
+        RegistryPayloadTooLarge: If the widget is too large.
+
+    """
+    threshold = settings.SELECT2_REGISTRY_COMPRESS_THRESHOLD
+    max_size = settings.SELECT2_REGISTRY_MAX_SIZE
+    if threshold is None and max_size is None:
+        return value
+
+    pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+    widget = _widget(value)
+    payload, size = value, len(pickled)
+    if threshold is not None and len(pickled) > threshold:
+        algorithm = settings.SELECT2_REGISTRY_COMPRESSION
+        payload = Compressed(algorithm, _compressor(algorithm).compress(pickled))
+        size = len(payload.data)
+        metrics.observe(
+            "registry.compression_ratio", len(pickled) / size, widget=widget
+        )
+    metrics.observe("registry.write_bytes", size, widget=widget)
+
+    if max_size is not None and size > max_size:
+        msg = (
+            "The registry entry of %s is %d bytes, which exceeds"
+            " SELECT2_REGISTRY_MAX_SIZE of %d bytes. Reduce the size of its"
+            " QuerySet or enable SELECT2_REGISTRY_COMPRESS_THRESHOLD."
+            % (widget, size, max_size)
+        )
+        if settings.SELECT2_REGISTRY_MAX_SIZE_ACTION == "raise":
+            raise RegistryPayloadTooLarge(msg)
+        logger.warning(msg)
+    return payload
+
+
+def decode(payload):
+    """Return the widget of a payload returned by :func:`encode`."""
+    if isinstance(payload, Compressed):
+        data = _compressor(payload.algorithm).decompress(payload.data)
+        return pickle.loads(data)  # nosec
+    return payload
+
+
+def _unpickle(data):
+    try:
+        return decode(pickle.loads(data))  # nosec
+    except Exception:
+        return None
+
+
+TOKEN_PREFIX = "t:"
+TOKEN_SALT = "django_select2.registry.token"
+
+
+def _token_spec(value):
+    # Only widgets whose QuerySet is the default QuerySet of their model can
+    # be represented as JSON, without exposing the values of any filter.
+    try:
+        queryset, query = value["queryset"]
+        cls = value["cls"]
+    except (TypeError, KeyError, ValueError):
+        return None
+    model = queryset.model
+    try:
+        if str(query) != str(model._default_manager.all().query):
+            return None
+    except EmptyResultSet:
+        return None
+    spec = {key: item for key, item in value.items() if key not in ("queryset", "cls")}
+    spec.update(
+        cls="%s.%s" % (cls.__module__, cls.__qualname__),
+        model=model._meta.label,
+        db=queryset._db,
+    )
+    return spec
+
+
+def dumps_token(value):
+    """
+    Return a ``field_id`` that contains the widget ``value`` itself.
+
+    The token is a signed and compressed JSON spec of the widget. It is not
+    encrypted: it reveals the widget class, model, search fields and URL.
+    Only widgets whose QuerySet is the default QuerySet of their model can
+    be encoded, filtered QuerySets are never exposed.
+
+    Returns:
+        str: Signed token or ``None``, if the widget can't be represented as
+        JSON or its token exceeds ``SELECT2_STATELESS_TOKEN_MAX_SIZE``.
+
+    """
+    spec = _token_spec(value)
+    if spec is None:
+        return None
+    try:
+        token = TOKEN_PREFIX + signing.dumps(spec, salt=TOKEN_SALT, compress=True)
+    except (TypeError, ValueError):
+        return None
+    if len(token) > settings.SELECT2_STATELESS_TOKEN_MAX_SIZE:
+        return None
+    return token
+
+
+def is_token(field_id):
+    """Return whether ``field_id`` was returned by :func:`dumps_token`."""
+    return field_id.startswith(TOKEN_PREFIX)
+
+
+def loads_token(field_id):
+    """
+    Return the widget contained in a token returned by :func:`dumps_token`.
+
+    Tokens expire like registry entries, after the registry's timeout.
+
+    Returns:
+        dict: The widget or ``None``, if the token expired.
+
+    Raises:
+        django.core.signing.BadSignature: If the token has been tampered with.
+
+    """
+    from .forms import ModelSelect2Mixin
+
+    try:
+        spec = signing.loads(
+            field_id[len(TOKEN_PREFIX) :],
+            salt=TOKEN_SALT,
+            max_age=get_registry().timeout,
+        )
+    except signing.SignatureExpired:
+        return None
+    try:
+        cls = import_string(spec.pop("cls"))
+        queryset = apps.get_model(spec.pop("model"))._default_manager.all()
+    except (ImportError, LookupError, ValueError):
+        raise signing.BadSignature("Invalid widget in token.")
+    if not (isinstance(cls, type) and issubclass(cls, ModelSelect2Mixin)):
+        raise signing.BadSignature("Invalid widget in token.")
+    db = spec.pop("db")
+    if db is not None:
+        queryset = queryset.using(db)
+    spec.update(cls=cls, queryset=[queryset, queryset.query])
+    return spec
+
+
+class BaseRegistry:
+    """
+    Interface of the widget registries.
+
+    Subclasses implement :meth:`write` and :meth:`read` to store payloads.
+    If ``SELECT2_REGISTRY_DEDUPLICATE`` is enabled, widgets are stored once
+    per distinct content under a hash of their pickle, the "spec", and every
+    rendered instance only stores a small :class:`SpecPointer` to it.
+    Existing specs are :meth:`touched <touch>` instead of rewritten.
+    Specs are immutable and kept in a local cache of :attr:`spec_cache_size`
+    entries by readers.
+    """
+
+    timeout = None
+    """Seconds until a widget expires."""
+
+    spec_cache_size = 128
+    """Number of specs kept in memory, see ``SELECT2_REGISTRY_DEDUPLICATE``."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._specs = OrderedDict()
+
+    def write(self, key, payload):
+        """Store ``payload`` under ``key``."""
+        raise NotImplementedError
+
+    def read(self, key):
+        """Return the payload stored under ``key`` or ``None``."""
+        raise NotImplementedError
+
+    def touch(self, key):
+        """
+        Reset the expiry of the payload stored under ``key``.
+
+        Returns:
+            bool: ``True``, if the payload exists.
+
+        """
+        return False
+
+    def set(self, key, value):
+        """Register the widget ``value`` under ``key``."""
+        if not settings.SELECT2_REGISTRY_DEDUPLICATE or not _deduplicable(value):
+            self.write(key, encode(value))
+            return
+        pointer = self._get_pointer(value)
+        self.write(key, encode(pointer))
+        # Written after the pointer, the spec does not expire before it.
+        self._set_spec(pointer.key, value)
+
+    def get(self, key):
+        """Return the widget registered under ``key`` or ``None``."""
+        value = decode(self.read(key))
+        if isinstance(value, SpecPointer):
+            value = self._get_spec(value.key)
+        return value
+
+    def _get_pointer(self, value):
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        spec_key = "%sspec_%s" % (
+            settings.SELECT2_CACHE_PREFIX,
+            hashlib.sha256(pickled).hexdigest(),
+        )
+        return SpecPointer(spec_key, _widget(value))
+
+    def _set_spec(self, spec_key, value):
+        # Extend the expiry of an existing spec, to outlive the new pointer.
+        if self.touch(spec_key):
+            metrics.increment("registry.spec_hit")
+        else:
+            self.write(spec_key, encode(value))
+            metrics.increment("registry.spec_write")
+
+    def _get_spec(self, spec_key):
+        with self._lock:
+            spec = self._specs.get(spec_key)
+            if spec is not None:
+                self._specs.move_to_end(spec_key)
+        if spec is None:
+            spec = decode(self.read(spec_key))
+            if spec is None:
+                return None
+            with self._lock:
+                self._specs[spec_key] = spec
+                while len(self._specs) > self.spec_cache_size:
+                    self._specs.popitem(last=False)
+        # Specs are shared, readers may modify their copy.
+        return dict(spec)
+
+    def purge(self):
+        """
+        Delete all expired widgets.
+
+        Returns:
+            int: Number of deleted widgets, if known.
+
+        """
+        return 0
+
+    def scan(self):
+        """
+        Iterate over all registered widgets.
+
+        Returns:
+            Iterator[Registration]: Registered widgets.
+
+        Raises:
+            NotImplementedError: If the storage can't be scanned.
+
+        """
+        raise NotImplementedError("%s can not be scanned." % self.__class__.__name__)
+
+    def delete(self, keys):
+        """Delete the widgets registered under ``keys`` returned by :meth:`scan`."""
+        raise NotImplementedError
+
+
+class CacheRegistry(BaseRegistry):
+    """
+    Registry storing widgets in the cache backend, expired by the cache.
+
+    The widgets can be scanned in local memory, file based and database
+    caches, as well as in caches that implement ``iter_keys`` and ``ttl``
+    like django-redis.
+    """
+
+    @property
+    def timeout(self):
+        return cache.default_timeout
+
+    def write(self, key, payload):
+        cache.set(key, payload)
+
+    def read(self, key):
+        return cache.get(key)
+
+    def touch(self, key):
+        return cache.touch(key)
+
+    def scan(self):
+        from django.core.cache.backends.db import DatabaseCache
+        from django.core.cache.backends.filebased import FileBasedCache
+        from django.core.cache.backends.locmem import LocMemCache
+
+        backend = _backend()
+        prefix = settings.SELECT2_CACHE_PREFIX
+        if isinstance(backend, LocMemCache):
+            return _scan_locmem(backend, prefix)
+        if isinstance(backend, FileBasedCache):
+            return _scan_filebased(backend)
+        if isinstance(backend, DatabaseCache):
+            return _scan_database(backend, prefix)
+        if hasattr(backend, "iter_keys") and hasattr(backend, "ttl"):
+            return _scan_iter_keys(backend, prefix)
+        return super().scan()
+
+    def delete(self, keys):
+        from django.core.cache.backends.filebased import FileBasedCache
+
+        backend = _backend()
+        if isinstance(backend, FileBasedCache):
+            # File names are hashed, the keys are the paths.
+            for path in keys:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+        else:
+            backend.delete_many(keys)
+
+
+def _backend():
+    from django.core.cache import caches
+
+    return caches[settings.SELECT2_CACHE_BACKEND]
+
+
+def _scan_locmem(backend, prefix):
+    key_prefix = backend.make_key("")
+    raw_prefix = backend.make_key(prefix)
+    with backend._lock:
+        items = [
+            (key, pickled, backend._expire_info.get(key))
+            for key, pickled in backend._cache.items()
+            if key.startswith(raw_prefix)
+        ]
+    for key, pickled, expires in items:
+        yield Registration(
+            key[len(key_prefix) :], _widget(_unpickle(pickled)), len(pickled), expires
+        )
+
+
+def _scan_filebased(backend):
+    # File names are hashed, widgets are identified by their content.
+    for path in glob.glob(os.path.join(backend._dir, "*" + backend.cache_suffix)):
+        try:
+            with open(path, "rb") as f:
+                expires = pickle.load(f)  # nosec
+                pickled = zlib.decompress(f.read())
+        except (OSError, EOFError, zlib.error, pickle.UnpicklingError):
+            continue
+        value = _unpickle(pickled)
+        if isinstance(value, SpecPointer) or (
+            isinstance(value, dict) and "url" in value and _widget(value)
+        ):
+            yield Registration(path, _widget(value), len(pickled), expires)
+
+
+def _scan_database(backend, prefix):
+    key_prefix = backend.make_key("")
+    db = router.db_for_read(backend.cache_model_class)
+    connection = connections[db]
+    quote_name = connection.ops.quote_name
+    expression = models.Expression(output_field=models.DateTimeField())
+    converters = connection.ops.get_db_converters(
+        expression
+    ) + expression.get_db_converters(connection)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT %s, %s, %s FROM %s WHERE %s LIKE %%s"
+            % (
+                quote_name("cache_key"),
+                quote_name("value"),
+                quote_name("expires"),
+                quote_name(backend._table),
+                quote_name("cache_key"),
+            ),
+            # Underscores are wildcards, the keys are filtered below.
+            [backend.make_key(prefix).replace("%", "_") + "%"],
+        )
+        raw_prefix = backend.make_key(prefix)
+        while True:
+            rows = cursor.fetchmany(1000)
+            if not rows:
+                break
+            for key, value, expires in rows:
+                if not key.startswith(raw_prefix):
+                    continue
+                for converter in converters:
+                    expires = converter(expires, expression, connection)
+                pickled = base64.b64decode(value.encode())
+                yield Registration(
+                    key[len(key_prefix) :],
+                    _widget(_unpickle(pickled)),
+                    len(pickled),
+                    expires.timestamp() if expires else None,
+                )
+
+
+def _scan_iter_keys(backend, prefix):
+    now = time.time()
+    for key in backend.iter_keys(prefix + "*"):
+        payload = backend.get(key)
+        if payload is None:
+            continue
+        ttl = backend.ttl(key)
+        yield Registration(
+            key,
+            _widget(decode(payload)),
+            len(pickle.dumps(payload, pickle.HIGHEST_PROTOCOL)),
+            None if ttl is None else now + ttl,
+        )
+
+
+class DatabaseRegistry(BaseRegistry):
+    """
+    Registry storing widgets in the :class:`.WidgetRegistration` table.
+
+    All queries run on the write database of the model. Lookups right after
+    a render must find the widget, even if replicas lag behind.
+    """
+
+    timeout = 300
+    """Seconds until a widget expires, like the default of Django's cache."""
+
+    batch_size = 10000
+    """Number of expired widgets deleted per query by :meth:`purge`."""
+
+    @property
+    def model(self):
+        from .models import WidgetRegistration
+
+        return WidgetRegistration
+
+    @property
+    def objects(self):
+        return self.model._default_manager.db_manager(router.db_for_write(self.model))
+
+    def _expires(self):
+        return timezone.now() + datetime.timedelta(seconds=self.timeout)
+
+    def write(self, key, payload):
+        data = pickle.dumps(payload, pickle.HIGHEST_PROTOCOL)
+        expires = self._expires()
+        objects = self.objects
+        # Widgets of form classes keep their key across requests, most
+        # writes update an existing row.
+        if objects.filter(key=key).update(value=data, expires=expires):
+            return
+        try:
+            with transaction.atomic(using=objects.db):
+                objects.create(key=key, value=data, expires=expires)
+        except IntegrityError:
+            # Another process created the row in the meantime.
+            objects.filter(key=key).update(value=data, expires=expires)
+
+    def touch(self, key):
+        return bool(
+            self.objects.filter(key=key, expires__gt=timezone.now()).update(
+                expires=self._expires()
+            )
+        )
+
+    def read(self, key):
+        data = (
+            self.objects.filter(key=key, expires__gt=timezone.now())
+            .values_list("value", flat=True)
+            .first()
+        )
+        if data is None:
+            return None
+        return pickle.loads(bytes(data))  # nosec
+
+    def scan(self):
+        for key, value, expires in (
+            self.objects.order_by().values_list("key", "value", "expires")
+        ).iterator():
+            pickled = bytes(value)
+            yield Registration(
+                key, _widget(_unpickle(pickled)), len(pickled), expires.timestamp()
+            )
+
+    def delete(self, keys):
+        self.objects.filter(key__in=list(keys)).delete()
+
+    def purge(self):
+        """Delete expired widgets in batches of :attr:`batch_size`."""
+        deleted = 0
+        now = timezone.now()
+        while True:
+            keys = list(
+                self.objects.filter(expires__lte=now)
+                .order_by("expires")
+                .values_list("key", flat=True)[: self.batch_size]
+            )
+            if not keys:
+                return deleted
+            deleted += self.objects.filter(key__in=keys).delete()[0]
+
+
+def get_registry():
+    """Return the registry defined in ``SELECT2_REGISTRY_BACKEND``."""
+    global _registry
+    if _registry is None:
+        _registry = import_string(settings.SELECT2_REGISTRY_BACKEND)()
+    return _registry
+
+
+@receiver(setting_changed)
+def _reset_registry(setting, **kwargs):
+    global _registry
+    if setting == "SELECT2_REGISTRY_BACKEND":
+        _registry = None
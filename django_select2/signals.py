@@ -0,0 +1,27 @@
+"""
+Signals sent by :class:`.AutoResponseView`.
+
+Every lookup is split into phases, e.g. ``registry``, ``widget``, ``count``,
+``query``, ``label`` and ``json``. Connect to these signals to record the
+timings or to wrap the phases in tracing spans::
+
+    from django.dispatch import receiver
+    from django_select2.signals import lookup_phase_finished
+
+    @receiver(lookup_phase_finished)
+    def log_phase(sender, view, phase, duration, **kwargs):
+        logger.debug("%s took %.1f ms", phase, duration * 1000)
+
+"""
+from django.dispatch import Signal
+
+__all__ = ("lookup_phase_started", "lookup_phase_finished", "lookup_finished")
+
+lookup_phase_started = Signal()
+"""Sent before a phase of a lookup starts, with the ``view`` and ``phase``."""
+
+lookup_phase_finished = Signal()
+"""Sent after a phase of a lookup, with the ``view``, ``phase`` and ``duration``."""
+
+lookup_finished = Signal()
+"""Sent after a lookup, with the ``view`` and its ``timings`` in seconds by phase."""
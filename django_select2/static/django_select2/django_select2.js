@@ -14,27 +14,254 @@
     $element.select2(options)
   }
 
+  var maxRetries = 3
+
+  // Least recently used cache for lookup results, shared by all fields on a page.
+  var ResultCache = function (size, ttl) {
+    this.size = size
+    this.ttl = ttl
+    this.clear()
+  }
+
+  ResultCache.prototype.clear = function () {
+    this.keys = []
+    this.entries = {}
+  }
+
+  ResultCache.prototype.get = function (key) {
+    if (!Object.prototype.hasOwnProperty.call(this.entries, key)) {
+      return undefined
+    }
+    var entry = this.entries[key]
+    this.keys.splice($.inArray(key, this.keys), 1)
+    if (new Date().getTime() - entry.time > this.ttl) {
+      delete this.entries[key]
+      return undefined
+    }
+    this.keys.push(key)
+    return entry.data
+  }
+
+  ResultCache.prototype.set = function (key, data) {
+    if (this.size <= 0) {
+      return
+    }
+    if (Object.prototype.hasOwnProperty.call(this.entries, key)) {
+      this.keys.splice($.inArray(key, this.keys), 1)
+    }
+    this.keys.push(key)
+    this.entries[key] = { data: data, time: new Date().getTime() }
+    while (this.keys.length > this.size) {
+      delete this.entries[this.keys.shift()]
+    }
+  }
+
+  var resultCache = new ResultCache(100, 60 * 1000)
+
+  var cacheKey = function (params) {
+    return params.url + '?' + $.param(params.data || {})
+  }
+
+  var inflight = {}
+
+  // Send a lookup, or join an identical lookup that is already in flight.
+  var fetch = function (params, key) {
+    var xhr = inflight[key]
+    if (!xhr) {
+      xhr = inflight[key] = $.ajax(params)
+      xhr.users = 0
+      xhr.always(function () {
+        delete inflight[key]
+      }).done(function (data) {
+        // A timed out lookup may succeed, once the database is less busy.
+        if (!data.timed_out) {
+          resultCache.set(key, data)
+        }
+      })
+    }
+    xhr.users++
+    return xhr
+  }
+
+  // Abort a lookup, unless other fields or a prefetch are waiting for it.
+  var release = function (xhr) {
+    xhr.users--
+    if (xhr.users === 0) {
+      xhr.abort()
+    }
+  }
+
+  // Select2 aborts the request of the previous term itself. The transport
+  // adds the result cache and joins identical lookups of other fields.
+  var transport = function (params, success, failure) {
+    var key = cacheKey(params)
+    var data = resultCache.get(key)
+    if (data !== undefined) {
+      success(data)
+      return { abort: function () {} }
+    }
+
+    var request = {}
+    var retries = 0
+    var send = function () {
+      var xhr = request.xhr = fetch(params, key)
+      xhr.then(function (data) {
+        if (request.xhr === xhr) {
+          request.xhr = null
+          success(data)
+        }
+      }, function (jqXHR, textStatus) {
+        if (request.xhr !== xhr || textStatus === 'abort') {
+          return
+        }
+        request.xhr = null
+        if (jqXHR.status === 429 && retries < maxRetries) {
+          // The server throttles this client, retry once we are allowed to.
+          retries++
+          var retryAfter = parseFloat(jqXHR.getResponseHeader('Retry-After')) || 1
+          request.timeout = setTimeout(send, retryAfter * 1000)
+          return
+        }
+        failure(jqXHR, textStatus)
+      })
+    }
+    send()
+    return {
+      abort: function () {
+        clearTimeout(request.timeout)
+        if (request.xhr) {
+          var xhr = request.xhr
+          request.xhr = null
+          release(xhr)
+        }
+      }
+    }
+  }
+
+  // Load results into the result cache, before they are requested.
+  var prefetch = function ($element, params) {
+    var ajax = $element.data('select2').options.get('ajax')
+    var request = $.extend({ type: 'GET' }, ajax)
+    if (typeof request.url === 'function') {
+      request.url = request.url.call($element, params)
+    }
+    request.data = request.data.call($element, params)
+    var key = cacheKey(request)
+    if (resultCache.get(key) === undefined && !inflight[key]) {
+      var pending = $element.data('select2-prefetch')
+      if (pending) {
+        release(pending.xhr)
+      }
+      var xhr = fetch(request, key)
+      $element.data('select2-prefetch', { term: params.term, xhr: xhr })
+      xhr.always(function () {
+        if (($element.data('select2-prefetch') || {}).xhr === xhr) {
+          $element.removeData('select2-prefetch')
+        }
+      })
+    }
+  }
+
+  // Abort the pending prefetch of the element, unless it is for the term
+  // that is queried, e.g. because the user scrolls to the next page.
+  var cancelPrefetch = function ($element, term) {
+    var pending = $element.data('select2-prefetch')
+    if (pending && pending.term !== term) {
+      $element.removeData('select2-prefetch')
+      release(pending.xhr)
+    }
+  }
+
+  // Add the values of the fields the element depends on to the request data.
+  var addDependentFields = function ($element, data) {
+    var dependentFields = $element.data('select2-dependent-fields')
+    if (dependentFields) {
+      dependentFields = dependentFields.trim().split(/\s+/)
+      $.each(dependentFields, function (i, dependentField) {
+        data[dependentField] = $('[name=' + dependentField + ']', $element.closest('form')).val()
+      })
+    }
+    return data
+  }
+
+  // Fetch the labels of lazily rendered selected options in batches,
+  // whenever the user scrolls to the end of the selection.
+  var initLazyLabels = function ($element) {
+    var batchSize = parseInt($element.data('label-batch-size'), 10) || 100
+    var $selection = $element.data('select2').$selection
+    var loading = false
+
+    var load = function () {
+      var $options = $element.find('option:selected').filter(function () {
+        return !$(this).data('labeled')
+      }).slice(0, batchSize)
+      if (loading || !$options.length) {
+        return
+      }
+      loading = true
+      $options.data('labeled', true)
+      $.ajax({
+        url: $element.attr('data-ajax--url'),
+        data: addDependentFields($element, {
+          field_id: $element.data('field_id'),
+          ids: $options.map(function () { return this.value }).get().join(',')
+        })
+      }).done(function (data) {
+        var labels = {}
+        $.each(data.results, function (i, result) {
+          labels[result.id] = result.text
+        })
+        $options.each(function () {
+          if (Object.prototype.hasOwnProperty.call(labels, this.value)) {
+            // Select2 caches the data of options, replace them to update the labels.
+            var option = new Option(labels[this.value], this.value, true, true)
+            $(this).replaceWith($(option).data('labeled', true))
+          }
+        })
+        $element.trigger('change.select2')
+      }).always(function () {
+        loading = false
+        loadVisible()
+      })
+    }
+
+    var loadVisible = function () {
+      var selection = $selection[0]
+      if (selection.scrollTop + selection.clientHeight >= selection.scrollHeight - 50) {
+        load()
+      }
+    }
+
+    $selection.css({ maxHeight: '10em', overflowY: 'auto' }).on('scroll', loadVisible)
+    load()
+  }
+
   var initHeavy = function ($element, options) {
     var settings = $.extend({
       ajax: {
+        delay: 250,
+        transport: transport,
         data: function (params) {
-          var result = {
+          cancelPrefetch($element, params.term)
+          return addDependentFields($element, {
             term: params.term,
             page: params.page,
             field_id: $element.data('field_id')
+          })
+        },
+        processResults: function (data, params) {
+          if (data.timed_out) {
+            // The server canceled the lookup, ask the user to refine the term.
+            var message = $element.data('select2').options.get('translations').get('errorLoading')
+            return {
+              results: [{ id: '', text: message(), disabled: true }],
+              pagination: { more: false }
+            }
           }
-
-          var dependentFields = $element.data('select2-dependent-fields')
-          if (dependentFields) {
-            dependentFields = dependentFields.trim().split(/\s+/)
-            $.each(dependentFields, function (i, dependentField) {
-              result[dependentField] = $('[name=' + dependentField + ']', $element.closest('form')).val()
-            })
+          if (data.more) {
+            // Prefetch the next page, while the user scrolls through this one.
+            prefetch($element, { term: params.term, page: (params.page || 1) + 1 })
           }
-
-          return result
-        },
-        processResults: function (data, page) {
           return {
             results: data.results,
             pagination: {
@@ -46,6 +273,18 @@
     }, options)
 
     $element.select2(settings)
+
+    if ($element.data('lazy-labels')) {
+      initLazyLabels($element)
+    }
+
+    var select2 = $element.data('select2')
+    if (!select2.options.get('minimumInputLength')) {
+      // Prefetch the first page, when the user is about to open the dropdown.
+      select2.$container.on('mouseenter focusin', function () {
+        prefetch($element, {})
+      })
+    }
   }
 
   $.fn.djangoSelect2 = function (options) {
@@ -67,6 +306,8 @@
     return this
   }
 
+  $.fn.djangoSelect2.resultCache = resultCache
+
   $(function () {
     $('.django-select2').djangoSelect2()
   })
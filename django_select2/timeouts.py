@@ -0,0 +1,126 @@
+"""
+Statement timeouts of autocomplete lookups.
+
+A term that matches no index can keep a lookup busy long after the client
+moved on. :func:`.statement_timeout` cancels the queries of a lookup once
+its deadline has passed:
+
+* PostgreSQL sets ``statement_timeout`` for the duration of a transaction.
+* MySQL and MariaDB set ``max_execution_time`` or ``max_statement_time``.
+* SQLite interrupts the query from a progress handler.
+
+On all databases, no further query is started after the deadline.
+"""
+import time
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections, transaction
+
+__all__ = ("QueryTimeout", "statement_timeout")
+
+
+class QueryTimeout(DatabaseError):
+    """The queries of a lookup exceeded their statement timeout."""
+
+
+@contextmanager
+def _postgresql(connection, seconds, deadline):
+    nested = connection.in_atomic_block
+    with transaction.atomic(using=connection.alias):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT current_setting('statement_timeout'),"
+                " set_config('statement_timeout', %s, true)",
+                [str(max(1, int(seconds * 1000)))],
+            )
+            previous = cursor.fetchone()[0]
+        yield
+        if nested:
+            # The setting would outlive the savepoint in the outer transaction.
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT set_config('statement_timeout', %s, true)", [previous]
+                )
+
+
+@contextmanager
+def _mysql(connection, seconds, deadline):
+    if connection.mysql_is_mariadb:
+        variable, value = "max_statement_time", seconds
+    else:
+        variable, value = "max_execution_time", max(1, int(seconds * 1000))
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT @@SESSION.%s" % variable)
+        previous = cursor.fetchone()[0]
+        cursor.execute("SET SESSION %s = %%s" % variable, [value])
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute("SET SESSION %s = %%s" % variable, [previous])
+
+
+@contextmanager
+def _sqlite(connection, seconds, deadline):
+    connection.ensure_connection()
+    connection.connection.set_progress_handler(
+        lambda: time.monotonic() >= deadline, 1000
+    )
+    try:
+        yield
+    finally:
+        connection.connection.set_progress_handler(None, 0)
+
+
+@contextmanager
+def _noop(connection, seconds, deadline):
+    yield
+
+
+_VENDORS = {
+    "postgresql": _postgresql,
+    "mysql": _mysql,
+    "sqlite": _sqlite,
+}
+
+
+@contextmanager
+def statement_timeout(seconds, using=DEFAULT_DB_ALIAS):
+    """
+    Cancel the queries run on the database ``using`` after ``seconds``.
+
+    Example::
+
+        with statement_timeout(0.5, using=queryset.db):
+            results = list(queryset)
+
+    Args:
+        seconds (float): Timeout of all queries in the block, ``None`` to disable.
+        using (str): Database alias.
+
+    Raises:
+        QueryTimeout: If a query was canceled or started after the deadline.
+
+    """
+    if not seconds:
+        yield
+        return
+    connection = connections[using]
+    deadline = time.monotonic() + seconds
+
+    def check_deadline(execute, sql, params, many, context):
+        if time.monotonic() >= deadline:
+            raise QueryTimeout("Statement timeout of %ss exceeded." % seconds)
+        return execute(sql, params, many, context)
+
+    vendor = _VENDORS.get(connection.vendor, _noop)
+    try:
+        with vendor(connection, seconds, deadline):
+            with connection.execute_wrapper(check_deadline):
+                yield
+    except QueryTimeout:
+        raise
+    except DatabaseError as e:
+        if time.monotonic() < deadline:
+            raise
+        raise QueryTimeout("Statement timeout of %ss exceeded." % seconds) from e
@@ -1,11 +1,25 @@
-"""JSONResponse views for model widgets."""
+"""JSONResponse views for heavy and model widgets."""
+import hashlib
+import math
+import time
+from contextlib import contextmanager
+from itertools import islice
+
 from django.core import signing
+from django.core.exceptions import ImproperlyConfigured, ValidationError
 from django.core.signing import BadSignature
 from django.http import Http404, JsonResponse
+from django.views.generic import View
 from django.views.generic.list import BaseListView
 
+from . import metrics, profiling
 from .cache import cache
+from .coalescing import coalesce
 from .conf import settings
+from .forms import ModelSelect2LazyMultipleWidget
+from .registry import get_registry, is_token, loads_token
+from .signals import lookup_finished, lookup_phase_finished, lookup_phase_started
+from .timeouts import QueryTimeout, statement_timeout
 
 
 class AutoResponseView(BaseListView):
@@ -15,6 +29,33 @@ class AutoResponseView(BaseListView):
     The view only supports HTTP's GET method.
     """
 
+    widget_class = None
+    """Class of the widget that served the lookup."""
+
+    def setup(self, request, *args, **kwargs):
+        """Initialize the timings of the lookup's phases."""
+        super().setup(request, *args, **kwargs)
+        self.timings = {}
+
+    @contextmanager
+    def timer(self, phase):
+        """
+        Time a phase of the lookup.
+
+        The duration is added to :attr:`timings` and reported via the
+        :mod:`django_select2.signals`.
+        """
+        lookup_phase_started.send(sender=self.__class__, view=self, phase=phase)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            self.timings[phase] = self.timings.get(phase, 0) + duration
+            lookup_phase_finished.send(
+                sender=self.__class__, view=self, phase=phase, duration=duration
+            )
+
     def get(self, request, *args, **kwargs):
         """
         Return a :class:`.django.http.JsonResponse`.
@@ -32,19 +73,142 @@ class AutoResponseView(BaseListView):
             }
 
         """
+        with profiling.sample(self):
+            retry_after = self.throttle()
+            if retry_after:
+                response = JsonResponse({"results": [], "more": False}, status=429)
+                response["Retry-After"] = str(math.ceil(retry_after))
+                return response
+            if settings.SELECT2_COALESCE_LOOKUPS:
+                start = time.perf_counter()
+                self.widget_class, data = coalesce(
+                    self.get_coalesce_key(), self._get_coalesced_response_data
+                )
+                if not self.timings:
+                    # The lookup waited for an identical one of another request.
+                    self.timings["coalesce"] = time.perf_counter() - start
+            else:
+                data = self.get_response_data()
+            with self.timer("json"):
+                response = JsonResponse(data)
+            if settings.SELECT2_SERVER_TIMING:
+                response["Server-Timing"] = ", ".join(
+                    "%s;dur=%.3f" % (phase, duration * 1000)
+                    for phase, duration in self.timings.items()
+                )
+            lookup_finished.send(sender=self.__class__, view=self, timings=self.timings)
+            tags = (
+                {"widget": metrics.get_tag(self.widget_class)}
+                if self.widget_class
+                else {}
+            )
+            metrics.increment("lookup", **tags)
+            metrics.observe("lookup.results", len(data["results"]), **tags)
+            metrics.observe("lookup.latency", sum(self.timings.values()), **tags)
+            return response
+
+    def _get_coalesced_response_data(self):
+        # Requests waiting for this lookup share the widget class for metrics.
+        data = self.get_response_data()
+        return self.widget_class, data
+
+    def get_response_data(self):
+        """Return results and pagination of the lookup."""
         self.widget = self.get_widget_or_404()
-        self.term = kwargs.get("term", request.GET.get("term", ""))
+        self.widget_class = self.widget.__class__
+        if "ids" in self.request.GET:
+            return self.get_label_data()
+        self.term = self.kwargs.get("term", self.request.GET.get("term", ""))
         self.object_list = self.get_queryset()
-        context = self.get_context_data()
-        return JsonResponse(
-            {
-                "results": [
-                    {"text": self.widget.label_from_instance(obj), "id": obj.pk}
-                    for obj in context["object_list"]
-                ],
-                "more": context["page_obj"].has_next(),
-            }
+        try:
+            with statement_timeout(self.get_query_timeout(), using=self.object_list.db):
+                with self.timer("count"):
+                    context = self.get_context_data()
+                with self.timer("query"):
+                    object_list = list(context["object_list"])
+                with self.timer("label"):
+                    results = [
+                        {"text": self.widget.label_from_instance(obj), "id": obj.pk}
+                        for obj in object_list
+                    ]
+        except QueryTimeout:
+            metrics.increment(
+                "lookup.timeout", widget=metrics.get_tag(self.widget.__class__)
+            )
+            return {"results": [], "more": False, "timed_out": True}
+        return {
+            "results": results,
+            "more": context["page_obj"].has_next(),
+        }
+
+    def get_label_data(self):
+        """
+        Return the labels of the comma separated keys ``ids``.
+
+        The JavaScript of :class:`.ModelSelect2LazyMultipleWidget` fetches the
+        labels of its selected values in batches. The values are looked up by
+        the field's ``to_field_name`` in the QuerySet of :meth:`get_queryset`,
+        i.e. restricted by :meth:`.ModelSelect2Mixin.filter_queryset` and the
+        dependent fields, but not by a search term.
+
+        Raises:
+            Http404: If the widget has no lazy labels or the ids are invalid.
+
+        """
+        if not isinstance(self.widget, ModelSelect2LazyMultipleWidget):
+            raise Http404("Labels are only served for lazy widgets.")
+        ids = [pk for pk in self.request.GET["ids"].split(",") if pk]
+        ids = ids[: self.widget.label_batch_size]
+        key = self.widget.to_field_name or "pk"
+        self.term = ""
+        queryset = self.get_queryset()
+        try:
+            with statement_timeout(self.get_query_timeout(), using=queryset.db):
+                with self.timer("query"):
+                    instances = {
+                        str(getattr(obj, key)): obj
+                        for obj in queryset.filter(**{"%s__in" % key: ids})
+                    }
+                with self.timer("label"):
+                    results = [
+                        {
+                            "text": self.widget.label_from_instance(obj),
+                            "id": getattr(obj, key),
+                        }
+                        for obj in (instances[pk] for pk in ids if pk in instances)
+                    ]
+        except QueryTimeout:
+            metrics.increment(
+                "lookup.timeout", widget=metrics.get_tag(self.widget.__class__)
+            )
+            return {"results": [], "more": False, "timed_out": True}
+        except (ValueError, TypeError, ValidationError):
+            raise Http404("Invalid ids.")
+        return {"results": results, "more": False}
+
+    def get_query_timeout(self):
+        """
+        Return seconds after which the queries of the lookup are canceled.
+
+        Timed out lookups respond with no results and ``"timed_out": true``.
+        """
+        if self.widget.query_timeout is not None:
+            return self.widget.query_timeout
+        return settings.SELECT2_QUERY_TIMEOUT
+
+    def get_coalesce_key(self):
+        """
+        Return key identifying identical lookups, see :attr:`.COALESCE_LOOKUPS`.
+
+        Lookups are identical, if they are sent to the same URL with the
+        same parameters.
+        """
+        key = "%s|%r|%r" % (
+            self.request.path,
+            sorted(self.request.GET.lists()),
+            sorted(self.kwargs.items()),
         )
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
 
     def get_queryset(self):
         """Get QuerySet from cached widget."""
@@ -54,14 +218,66 @@ class AutoResponseView(BaseListView):
             if form_field_name in self.request.GET
             and self.request.GET.get(form_field_name, "") != ""
         }
-        return self.widget.filter_queryset(
-            self.request, self.term, self.queryset, **kwargs
+        return self.widget.optimize_queryset(
+            self.widget.filter_queryset(
+                self.request, self.term, self.get_database_queryset(), **kwargs
+            )
         )
 
+    def get_database_queryset(self):
+        """Return the widget's QuerySet on its :attr:`.ModelSelect2Mixin.using` database."""
+        using = self.widget.using or settings.SELECT2_DATABASE
+        if using:
+            return self.queryset.using(using)
+        return self.queryset
+
     def get_paginate_by(self, queryset):
         """Paginate response by size of widget's `max_results` parameter."""
         return self.widget.max_results
 
+    def get_throttle_key(self):
+        """
+        Return cache key identifying the client and field of this request.
+
+        Clients are identified by their user, session or IP address.
+        """
+        user = getattr(self.request, "user", None)
+        session = getattr(self.request, "session", None)
+        if user is not None and user.is_authenticated:
+            client = "user:%s" % user.pk
+        elif session is not None and session.session_key:
+            client = "session:%s" % session.session_key
+        else:
+            client = "ip:%s" % self.request.META.get("REMOTE_ADDR", "")
+        field_id = self.kwargs.get("field_id", self.request.GET.get("field_id", ""))
+        digest = hashlib.sha256(
+            ("%s|%s" % (client, field_id)).encode("utf-8")
+        ).hexdigest()
+        return "%sthrottle_%s" % (settings.SELECT2_CACHE_PREFIX, digest)
+
+    def throttle(self):
+        """
+        Consume a token from the client's bucket, see :attr:`.THROTTLE_RATE`.
+
+        Returns:
+            float: Seconds the client needs to wait, if the request is throttled.
+
+        """
+        rate = settings.SELECT2_THROTTLE_RATE
+        if not rate:
+            return None
+        burst = settings.SELECT2_THROTTLE_BURST
+        key = self.get_throttle_key()
+        now = time.time()
+        tokens, timestamp = cache.get(key, (burst, now))
+        tokens = min(burst, tokens + (now - timestamp) * rate)
+        timeout = max(1, math.ceil(burst / rate))
+        if tokens < 1:
+            cache.set(key, (tokens, now), timeout)
+            return (1 - tokens) / rate
+        cache.set(key, (tokens - 1, now), timeout)
+        return None
+
     def get_widget_or_404(self):
         """
         Get and return widget from cache.
@@ -77,18 +293,160 @@ class AutoResponseView(BaseListView):
         if not field_id:
             raise Http404('No "field_id" provided.')
         try:
-            key = signing.loads(field_id)
+            with self.timer("registry"):
+                if is_token(field_id):
+                    widget_dict = loads_token(field_id)
+                else:
+                    key = signing.loads(field_id)
+                    cache_key = "%s%s" % (settings.SELECT2_CACHE_PREFIX, key)
+                    widget_dict = get_registry().get(cache_key)
         except BadSignature:
+            metrics.increment("registry.invalid_signature")
             raise Http404('Invalid "field_id".')
-        else:
-            cache_key = "%s%s" % (settings.SELECT2_CACHE_PREFIX, key)
-            widget_dict = cache.get(cache_key)
-            if widget_dict is None:
-                raise Http404("field_id not found")
-            if widget_dict.pop("url") != self.request.path:
-                raise Http404("field_id was issued for the view.")
-        qs, qs.query = widget_dict.pop("queryset")
-        self.queryset = qs.all()
-        widget_dict["queryset"] = self.queryset
-        widget_cls = widget_dict.pop("cls")
-        return widget_cls(**widget_dict)
+        if widget_dict is None:
+            metrics.increment("registry.miss")
+            raise Http404("field_id not found")
+        if widget_dict.pop("url") != self.request.path:
+            metrics.increment("registry.url_mismatch")
+            raise Http404("field_id was issued for the view.")
+        metrics.increment("registry.hit", widget=metrics.get_tag(widget_dict["cls"]))
+        with self.timer("widget"):
+            # The registered QuerySet may be shared, see SELECT2_REGISTRY_DEDUPLICATE.
+            qs, query = widget_dict.pop("queryset")
+            self.queryset = qs.all()
+            self.queryset.query = query.chain()
+            widget_dict["queryset"] = self.queryset
+            widget_cls = widget_dict.pop("cls")
+            return widget_cls(**widget_dict)
+
+
+class HeavyResponseView(View):
+    """
+    Base view that serves :class:`.HeavySelect2Widget` from any data source.
+
+    The items of :attr:`.source` are filtered by the search term lazily and
+    the iteration stops as soon as the requested page and the first item of
+    the next page are found. The response has the same format as the one
+    of :class:`.AutoResponseView`.
+
+    Example::
+
+        class NumberView(HeavyResponseView):
+            source = [(1, "One"), (2, "Two"), (3, "Three")]
+            max_results = 10
+
+        urlpatterns = [
+            path("numbers.json", NumberView.as_view(), name="numbers"),
+        ]
+
+        class MyForm(forms.Form):
+            number = forms.ChoiceField(
+                widget=HeavySelect2Widget(data_view="numbers")
+            )
+
+    The view only supports HTTP's GET method.
+    """
+
+    source = None
+    """
+    Items or a callable that returns the items of a lookup, e.g. a generator function.
+
+    Items are ``(id, text)`` tuples, ``{"id": …, "text": …}`` dictionaries
+    or values that serve as both.
+    """
+
+    max_results = 25
+    """Maximal results per page."""
+
+    cache_timeout = None
+    """Seconds the response data is cached for, see :meth:`.get_cache_key`."""
+
+    def get(self, request, *args, **kwargs):
+        """Return a :class:`.django.http.JsonResponse`."""
+        self.term = self.kwargs.get("term", request.GET.get("term", ""))
+        try:
+            self.page = int(request.GET.get("page") or 1)
+        except ValueError:
+            raise Http404("Invalid page.")
+        if self.page < 1:
+            raise Http404("Invalid page.")
+        if self.cache_timeout is None:
+            return JsonResponse(self.get_response_data())
+        key = self.get_cache_key()
+        data = cache.get(key)
+        if data is None:
+            data = self.get_response_data()
+            cache.set(key, data, self.cache_timeout)
+        return JsonResponse(data)
+
+    def get_cache_key(self):
+        """
+        Return cache key of the response data, see :attr:`.cache_timeout`.
+
+        Responses are cached per URL and parameters, except the widget's
+        ``field_id``. Override this method, if the source depends on the user.
+        """
+        params = sorted(
+            (key, values)
+            for key, values in self.request.GET.lists()
+            if key != "field_id"
+        )
+        key = "%s|%r|%r" % (self.request.path, params, sorted(self.kwargs.items()))
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return "%sheavy_%s" % (settings.SELECT2_CACHE_PREFIX, digest)
+
+    def get_source(self):
+        """Return the items of :attr:`.source`."""
+        if self.source is None:
+            raise ImproperlyConfigured(
+                "%(cls)s is missing a source. Define %(cls)s.source or override"
+                " %(cls)s.get_source()." % {"cls": self.__class__.__name__}
+            )
+        if callable(self.source):
+            return self.source()
+        return self.source
+
+    def serialize(self, item):
+        """
+        Return an item as ``{"id": …, "text": …}`` dictionary.
+
+        Args:
+            item: Item of the source.
+
+        Returns:
+            dict: Result of the response.
+
+        """
+        if isinstance(item, dict):
+            return item
+        if isinstance(item, (list, tuple)):
+            value, text = item
+            return {"id": value, "text": str(text)}
+        return {"id": item, "text": str(item)}
+
+    def filter_results(self, results, term):
+        """
+        Yield results whose text contains every word of the search term.
+
+        Args:
+            results (Iterable[dict]): Serialized items of the source.
+            term (str): Search term.
+
+        """
+        words = term.lower().split()
+        for result in results:
+            text = result["text"].lower()
+            if all(word in text for word in words):
+                yield result
+
+    def get_response_data(self):
+        """Return results and pagination of the lookup."""
+        results = self.filter_results(map(self.serialize, self.get_source()), self.term)
+        start = (self.page - 1) * self.max_results
+        page = list(islice(results, start, start + self.max_results + 1))
+        if not page and self.page > 1:
+            raise Http404("Invalid page.")
+        return {
+            "results": page[: self.max_results],
+            "more": len(page) > self.max_results,
+        }
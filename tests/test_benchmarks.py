@@ -0,0 +1,60 @@
+import pytest
+from django.urls import reverse
+
+from benchmarks import data, load, suites
+
+
+@pytest.fixture
+def dataset(db):
+    return data.generate(50, seed=1)
+
+
+def test_generate(dataset):
+    assert dataset["artist"] == 50
+    assert dataset["album"] == 50
+
+
+def test_random_terms():
+    terms = data.random_terms(3, 10, seed=1)
+    assert len(terms) == 10
+    assert all(len(term) == 3 for term in terms)
+    assert terms == data.random_terms(3, 10, seed=1)
+
+
+def test_suites(dataset):
+    results = (
+        suites.render_throughput(2)
+        + suites.lookup_latency(2, term_lengths=(0, 2), pages=(1,))
+        + suites.registry_payload_sizes()
+        + suites.cache_backend_throughput(2, backends=("registry",))
+        + suites.registry_purge(3)
+        + suites.import_time(1)
+    )
+    assert {r["benchmark"] for r in results} == {
+        "import",
+        "render",
+        "lookup",
+        "registry_payload",
+        "registry_write",
+        "registry_read",
+        "registry_purge",
+    }
+    for r in results:
+        assert set(r) == {"benchmark", "params", "metric", "value", "unit"}
+        assert r["value"] >= 0
+
+
+def test_load(transactional_db, live_server):
+    data.generate(50, seed=1)
+    widgets = load.register_widgets()
+    sessions = load.build_sessions(12, widgets, seed=1)
+    assert {kind for kind, requests in sessions} == set(load.SESSIONS)
+
+    records, duration = load.run(
+        live_server.url, reverse("django_select2:auto-json"), sessions, workers=3
+    )
+    assert 0 < len(records) <= sum(len(requests) for kind, requests in sessions)
+    summary = load.report(records, duration)
+    assert summary["statuses"] == {"200": len(records)}
+    assert summary["errors"] == []
+    assert summary["inconsistent"] == []
@@ -4,3 +4,23 @@ def test_default_cache():
     cache.set("key", "value")
 
     assert cache.get("key") == "value"
+
+
+def test_cache_backend_setting(settings):
+    from django.core.cache import caches
+
+    from django_select2.cache import cache
+
+    settings.CACHES = {
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+        "select2": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "select2",
+        },
+    }
+    settings.SELECT2_CACHE_BACKEND = "select2"
+    cache.set("backend_key", "value")
+
+    assert caches["select2"].get("backend_key") == "value"
+    assert caches["default"].get("backend_key") is None
+    assert "backend_key" in cache
@@ -0,0 +1,130 @@
+import threading
+import time
+
+import pytest
+
+from django_select2.cache import cache
+from django_select2.coalescing import SingleFlight, coalesce
+
+
+class TestSingleFlight:
+    def test_concurrent_calls(self):
+        single_flight = SingleFlight()
+        calls = []
+        started = threading.Event()
+
+        def func():
+            calls.append(1)
+            started.set()
+            time.sleep(0.2)
+            return "result"
+
+        results = []
+
+        def worker():
+            results.append(single_flight.do("key", func, timeout=5))
+
+        leader = threading.Thread(target=worker)
+        leader.start()
+        started.wait()
+        followers = [threading.Thread(target=worker) for _ in range(10)]
+        for thread in followers:
+            thread.start()
+        for thread in [leader] + followers:
+            thread.join()
+
+        assert len(calls) == 1
+        assert results == ["result"] * 11
+
+    def test_sequential_calls(self):
+        single_flight = SingleFlight()
+        assert single_flight.do("key", lambda: 1) == 1
+        assert single_flight.do("key", lambda: 2) == 2
+
+    def test_error(self):
+        single_flight = SingleFlight()
+        started = threading.Event()
+        errors = []
+
+        def func():
+            started.set()
+            time.sleep(0.1)
+            raise ValueError("boom")
+
+        def worker():
+            try:
+                single_flight.do("key", func, timeout=5)
+            except ValueError as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker) for _ in range(3)]
+        threads[0].start()
+        started.wait()
+        for thread in threads[1:]:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(errors) == 3
+        with pytest.raises(ValueError):
+            single_flight.do("key", func)
+
+    def test_timeout(self):
+        single_flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow():
+            started.set()
+            release.wait()
+            return "slow"
+
+        thread = threading.Thread(target=single_flight.do, args=("key", slow))
+        thread.start()
+        started.wait()
+        assert single_flight.do("key", lambda: "fast", timeout=0.01) == "fast"
+        release.set()
+        thread.join()
+
+
+class TestCoalesce:
+    def test_shared(self, settings):
+        settings.SELECT2_COALESCE_SHARED = True
+        calls = []
+
+        def func():
+            calls.append(1)
+            return {"results": [], "more": False}
+
+        assert coalesce("shared-key", func) == {"results": [], "more": False}
+        assert coalesce("shared-key", func) == {"results": [], "more": False}
+        # Sequential lookups are not served from a cache.
+        assert len(calls) == 2
+        assert cache.get("select2_coalesce_lock_shared-key") is None
+
+    def test_shared_locked(self, settings):
+        settings.SELECT2_COALESCE_SHARED = True
+        settings.SELECT2_COALESCE_TIMEOUT = 1
+        cache.set("select2_coalesce_lock_locked-key", "flight")
+
+        def other_process():
+            time.sleep(0.1)
+            cache.set("select2_coalesce_result_flight", "other")
+
+        thread = threading.Thread(target=other_process)
+        thread.start()
+        assert coalesce("locked-key", lambda: "self") == "other"
+        thread.join()
+        cache.delete("select2_coalesce_lock_locked-key")
+
+    def test_shared_locked__released(self, settings):
+        settings.SELECT2_COALESCE_SHARED = True
+        cache.set("select2_coalesce_lock_released-key", "released-flight")
+
+        def other_process():
+            time.sleep(0.1)
+            cache.delete("select2_coalesce_lock_released-key")
+
+        thread = threading.Thread(target=other_process)
+        thread.start()
+        assert coalesce("released-key", lambda: "self") == "self"
+        thread.join()
@@ -0,0 +1,168 @@
+import json
+import time
+from datetime import timedelta
+from io import StringIO
+
+import pytest
+from django.core.management import CommandError, call_command
+from django.utils import timezone
+
+from django_select2.forms import ModelSelect2Widget
+from django_select2.registry import DatabaseRegistry, get_registry
+from tests.testapp.forms import TitleModelSelect2Widget
+from tests.testapp.models import Genre
+
+GENRE_WIDGET = "django_select2.forms.ModelSelect2Widget"
+TITLE_WIDGET = "tests.testapp.forms.TitleModelSelect2Widget"
+
+BACKENDS = {
+    "locmem": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "select2-commands",
+    },
+    "file": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache"},
+    "db": {
+        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+        "LOCATION": "select2_commands_cache",
+    },
+    "redis": {
+        "BACKEND": "tests.testapp.cache.RedisLikeCache",
+        "LOCATION": "select2-commands-redis",
+    },
+}
+
+
+@pytest.fixture(params=[*BACKENDS, "registry"])
+def registry(request, settings, transactional_db, tmp_path):
+    if request.param == "registry":
+        settings.SELECT2_REGISTRY_BACKEND = "django_select2.registry.DatabaseRegistry"
+    else:
+        backend = dict(BACKENDS[request.param])
+        if request.param == "file":
+            backend["LOCATION"] = str(tmp_path)
+        settings.CACHES = {
+            "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+            "select2": backend,
+        }
+        settings.SELECT2_CACHE_BACKEND = "select2"
+        if request.param == "db":
+            call_command("createcachetable", "select2_commands_cache")
+    registry = get_registry()
+    yield registry
+    if request.param != "registry":
+        from django.core.cache import caches
+
+        caches["select2"].clear()
+
+
+def register(widget_class, count):
+    widgets = []
+    for _ in range(count):
+        widget = widget_class(
+            queryset=Genre.objects.all(), search_fields=["title__icontains"]
+        )
+        widget.render("genre", None)
+        widgets.append(widget)
+    return widgets
+
+
+def inspect(*args):
+    stdout = StringIO()
+    call_command("select2_registry", "inspect", "--json", *args, stdout=stdout)
+    return json.loads(stdout.getvalue())
+
+
+def test_inspect(registry):
+    register(ModelSelect2Widget, 3)
+    register(TitleModelSelect2Widget, 2)
+    report = inspect()
+    assert report["entries"] == 5
+    assert report["bytes"] > 0
+    assert report["widgets"][GENRE_WIDGET]["entries"] == 3
+    assert report["widgets"][TITLE_WIDGET]["entries"] == 2
+    assert report["widgets"][GENRE_WIDGET]["ttl"]["max"] <= registry.timeout
+    assert sum(report["sizes"].values()) == 5
+    assert report["ttls"] == {"< 300s": 5}
+    assert report["oversized"] == []
+
+    report = inspect("--oversized", "10")
+    assert len(report["oversized"]) == 5
+
+
+def test_inspect__text(registry):
+    register(ModelSelect2Widget, 1)
+    stdout = StringIO()
+    call_command("select2_registry", "inspect", "--oversized", "10", stdout=stdout)
+    output = stdout.getvalue()
+    assert "1 entries" in output
+    assert GENRE_WIDGET in output
+    assert "Oversized" in output
+
+
+def test_purge__widget(registry):
+    register(ModelSelect2Widget, 3)
+    register(TitleModelSelect2Widget, 2)
+    stdout = StringIO()
+    call_command(
+        "select2_registry",
+        "purge",
+        "--widget",
+        TITLE_WIDGET,
+        "--batch-size",
+        "1",
+        stdout=stdout,
+    )
+    assert "Deleted 2 entries." in stdout.getvalue()
+    assert set(inspect()["widgets"]) == {GENRE_WIDGET}
+
+
+def test_purge__older_than(registry, monkeypatch):
+    register(ModelSelect2Widget, 2)
+    call_command("select2_registry", "purge", "--older-than", "60", stdout=StringIO())
+    assert inspect()["entries"] == 2
+
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 120)
+    call_command("select2_registry", "purge", "--older-than", "60", stdout=StringIO())
+    monkeypatch.undo()
+    assert inspect()["entries"] == 0
+
+
+def test_purge__dry_run(registry):
+    register(ModelSelect2Widget, 2)
+    stdout = StringIO()
+    call_command("select2_registry", "purge", "--all", "--dry-run", stdout=stdout)
+    assert "Would delete 2 entries." in stdout.getvalue()
+    assert inspect()["entries"] == 2
+
+
+def test_purge__expired(registry, monkeypatch):
+    register(ModelSelect2Widget, 2)
+    if isinstance(registry, DatabaseRegistry):
+        registry.objects.update(expires=timezone.now() - timedelta(seconds=1))
+
+        def scan():
+            raise AssertionError("purge --expired must not scan the registry.")
+
+        monkeypatch.setattr(registry, "scan", scan)
+    else:
+        now = time.time()
+        monkeypatch.setattr(time, "time", lambda: now + registry.timeout + 1)
+    stdout = StringIO()
+    call_command("select2_registry", "purge", "--expired", stdout=stdout)
+    monkeypatch.undo()
+    assert "Deleted 2 entries." in stdout.getvalue()
+    assert inspect()["entries"] == 0
+
+
+def test_purge__no_filter(registry):
+    with pytest.raises(CommandError):
+        call_command("select2_registry", "purge")
+
+
+def test_unsupported_backend(settings):
+    settings.CACHES = {
+        "default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}
+    }
+    with pytest.raises(CommandError):
+        call_command("select2_registry", "inspect")
@@ -1,25 +1,35 @@
 import json
 import os
+import subprocess  # nosec
+import sys
 from collections.abc import Iterable
 
 import pytest
+from django import forms as django_forms
 from django.db.models import QuerySet
+from django.forms import formset_factory
 from django.urls import reverse
 from django.utils import translation
+from django.utils.datastructures import MultiValueDict
 from django.utils.encoding import force_str
 from selenium.common.exceptions import NoSuchElementException
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support import expected_conditions
 from selenium.webdriver.support.wait import WebDriverWait
 
+from django_select2 import forms as django_select2_forms
 from django_select2.cache import cache
 from django_select2.conf import settings
 from django_select2.forms import (
     HeavySelect2MultipleWidget,
     HeavySelect2Widget,
+    ModelSelect2LazyMultipleField,
+    ModelSelect2LazyMultipleWidget,
     ModelSelect2TagWidget,
     ModelSelect2Widget,
+    Select2MultipleWidget,
     Select2Widget,
+    prefetch_selected_choices,
 )
 from tests.testapp import forms
 from tests.testapp.forms import (
@@ -27,7 +37,7 @@ from tests.testapp.forms import (
     HeavySelect2MultipleWidgetForm,
     TitleModelSelect2Widget,
 )
-from tests.testapp.models import Artist, City, Country, Genre, Groupie
+from tests.testapp.models import Album, Artist, City, Country, Genre, Groupie
 
 
 class TestSelect2Mixin:
@@ -177,6 +187,29 @@ class TestSelect2MixinSettings:
         )
         assert "django_select2/django_select2.js" in result
 
+    def test_media_memoized(self):
+        translation.activate("de")
+        assert Select2Widget().media is Select2MultipleWidget().media
+        german_media = Select2Widget().media
+        translation.activate("en")
+        assert Select2Widget().media is not german_media
+
+    def test_form_media_merge(self):
+        class ManyWidgetsForm(django_forms.Form):
+            locals().update(
+                {
+                    "field_%d" % i: django_forms.ChoiceField(widget=Select2Widget)
+                    for i in range(100)
+                }
+            )
+            other = django_forms.DateField(
+                widget=django_forms.DateInput(attrs={"class": "date"})
+            )
+
+        media = ManyWidgetsForm().media
+        assert len([js for js in media._js_lists if js]) == 1
+        assert tuple(media._js) == tuple(Select2Widget().media._js)
+
     def test_js_setting(self, settings):
         settings.SELECT2_JS = "alternate.js"
         sut = Select2Widget()
@@ -203,6 +236,68 @@ class TestSelect2MixinSettings:
         assert ".css" not in result
 
 
+class TestSelect2OptionCache:
+    choices = [
+        (1, "One"),
+        ("Group", [(2, "Two"), (3, "Three")]),
+        (4, "<Four>"),
+    ]
+
+    @pytest.mark.parametrize("widget_cls", [Select2Widget, Select2MultipleWidget])
+    @pytest.mark.parametrize("is_required", [True, False])
+    @pytest.mark.parametrize("value", [None, 1, [2, 4]])
+    def test_render(self, widget_cls, is_required, value):
+        widget = widget_cls(choices=self.choices)
+        widget.is_required = is_required
+        cached_widget = widget_cls(choices=self.choices)
+        cached_widget.is_required = is_required
+        cached_widget.cache_options = True
+        expected = widget.render("name", value, attrs={"id": "id_name"})
+        assert cached_widget.render("name", value, attrs={"id": "id_name"}) == expected
+        assert cached_widget.render("name", value, attrs={"id": "id_name"}) == expected
+
+    def test_only_selected_options_rerendered(self, monkeypatch):
+        widget = Select2Widget(choices=[(i, str(i)) for i in range(100)])
+        widget.cache_options = True
+        widget.render("name", 1)
+        calls = []
+        monkeypatch.setattr(
+            widget,
+            "_render_option",
+            lambda option, renderer: calls.append(option) or "",
+        )
+        widget.render("name", 2)
+        assert [option["value"] for option in calls] == [2]
+
+    def test_language(self):
+        widget = Select2Widget(choices=[(1, translation.gettext_lazy("German"))])
+        widget.cache_options = True
+        with translation.override("de"):
+            assert "Deutsch" in widget.render("name", None)
+        with translation.override("en"):
+            assert "German" in widget.render("name", None)
+
+    def test_options(self):
+        class CachedForm(django_forms.Form):
+            number = django_forms.ChoiceField(
+                choices=self.choices, widget=Select2Widget
+            )
+
+        form = CachedForm()
+        form.fields["number"].widget.cache_options = True
+        assert [option.data["value"] for option in form["number"]] == [1, 2, 3, 4]
+        assert len(list(form.fields["number"].widget.options("number", []))) == 4
+        assert "One" in form.as_p()
+
+    def test_cache_size(self, settings):
+        settings.SELECT2_OPTION_CACHE_SIZE = 2
+        for i in range(3):
+            widget = Select2Widget(choices=[(i, str(i))])
+            widget.cache_options = True
+            widget.render("name", None)
+        assert len(django_select2_forms._option_cache) == 2
+
+
 class TestHeavySelect2Mixin(TestSelect2Mixin):
     url = reverse("heavy_select2_widget")
     form = forms.HeavySelect2WidgetForm(initial={"primary_genre": 1})
@@ -480,6 +575,49 @@ class TestModelSelect2Mixin(TestHeavySelect2Mixin):
         assert isinstance(cached_widget["queryset"][0], qs.__class__)
         assert str(cached_widget["queryset"][1]) == str(qs.query)
 
+    def test_render_optimizations(self):
+        widget = ModelSelect2Widget(
+            queryset=Album.objects.all(),
+            search_fields=["title__icontains"],
+            select_related=["artist"],
+            prefetch_related=["genres"],
+            only=["title", "artist__title"],
+        )
+        widget.render("name", None)
+        cached_widget = cache.get(widget._get_cache_key())
+        assert cached_widget["select_related"] == ("artist",)
+        assert cached_widget["prefetch_related"] == ("genres",)
+        assert cached_widget["only"] == ("title", "artist__title")
+        assert cached_widget["defer"] == ()
+
+    def test_optimize_queryset(self, django_assert_num_queries, artists):
+        album = Album.objects.create(title="Album", artist=artists[0])
+        field = django_forms.ModelChoiceField(
+            queryset=Album.objects.all(),
+            widget=ModelSelect2Widget(
+                search_fields=["title__icontains"],
+                select_related=["artist"],
+                defer=["primary_genre"],
+            ),
+        )
+        field.widget.label_from_instance = lambda obj: obj.artist.title
+        with django_assert_num_queries(1):
+            output = field.widget.render("album", album.pk)
+        assert artists[0].title in output
+
+    @pytest.mark.django_db(databases=["default", "replica"])
+    def test_selected_using(self):
+        genre = Genre.objects.create(title="Primary")
+        field = django_forms.ModelChoiceField(
+            queryset=Genre.objects.using("replica"),
+            widget=ModelSelect2Widget(
+                search_fields=["title__icontains"], selected_using="default"
+            ),
+        )
+        assert "Primary" in field.widget.render("genre", genre.pk)
+        field.widget.selected_using = None
+        assert "Primary" not in field.widget.render("genre", genre.pk)
+
     def test_get_url(self):
         widget = ModelSelect2Widget(
             queryset=Genre.objects.all(), search_fields=["title__icontains"]
@@ -503,6 +641,54 @@ class TestModelSelect2Mixin(TestHeavySelect2Mixin):
         )
 
 
+class TestPrefetchSelectedChoices:
+    def test_formset(self, django_assert_num_queries, artists, genres):
+        formset = formset_factory(forms.AlbumModelSelect2WidgetForm, extra=0)(
+            initial=[
+                {"artist": artist.pk, "primary_genre": genre.pk}
+                for artist, genre in zip(artists[:10], genres[:10])
+            ]
+        )
+        with django_assert_num_queries(2):
+            prefetch_selected_choices(formset)
+        with django_assert_num_queries(0):
+            output = formset.as_p()
+        for artist, genre in zip(artists[:10], genres[:10]):
+            assert artist.title.upper() in output
+            assert genre.title.upper() in output
+
+    def test_empty_selection(self, django_assert_num_queries, db):
+        form = forms.AlbumModelSelect2WidgetForm()
+        form.fields["primary_genre"].initial = None
+        with django_assert_num_queries(0):
+            prefetch_selected_choices(form)
+            form.as_p()
+
+    def test_changed_selection(self, django_assert_num_queries, genres):
+        form = forms.AlbumModelSelect2WidgetForm(
+            initial={"primary_genre": genres[0].pk}
+        )
+        prefetch_selected_choices(form)
+        widget = form.fields["primary_genre"].widget
+        with django_assert_num_queries(1):
+            output = widget.render("primary_genre", genres[1].pk)
+        assert genres[1].title.upper() in output
+
+    def test_lazy_widget(self, django_assert_num_queries, genres):
+        class LazyForm(django_forms.Form):
+            genres = ModelSelect2LazyMultipleField(
+                queryset=Genre.objects.all(),
+                widget=ModelSelect2LazyMultipleWidget(
+                    search_fields=["title__icontains"]
+                ),
+            )
+
+        form = LazyForm(initial={"genres": [g.pk for g in genres[:3]]})
+        with django_assert_num_queries(0):
+            prefetch_selected_choices(form)
+            form.as_p()
+
+
 class TestHeavySelect2TagWidget(TestHeavySelect2Mixin):
     def test_tag_attrs(self):
         widget = ModelSelect2TagWidget(
@@ -522,6 +708,130 @@ class TestHeavySelect2TagWidget(TestHeavySelect2Mixin):
         output = widget.render("name", "value")
         assert 'data-minimum-input-length="3"' in output
 
+    def test_value_from_datadict(self, db):
+        widget = ModelSelect2TagWidget(
+            queryset=Genre.objects.all(), search_fields=["title__icontains"]
+        )
+        assert widget.value_from_datadict({"tags": ["1", "new"]}, {}, "tags") == [
+            "1",
+            "new",
+        ]
+
+    def test_resolve_tags(self, django_assert_num_queries, genres):
+        widget = ModelSelect2TagWidget(
+            queryset=Genre.objects.all(),
+            search_fields=["title__icontains"],
+            natural_key_field="title",
+        )
+        new_titles = ["tag-%d" % i for i in range(200)]
+        data = {"tags": [str(genres[0].pk), genres[1].title, "", *new_titles]}
+        # savepoint, keys, natural keys, insert, natural keys, release
+        with django_assert_num_queries(6):
+            values = widget.value_from_datadict(data, {}, "tags")
+        assert len(values) == 202
+        assert values[:2] == [str(genres[0].pk), str(genres[1].pk)]
+        titles = dict(Genre.objects.values_list("pk", "title"))
+        assert [titles[int(pk)] for pk in values[2:]] == new_titles
+
+        # The tags of a submission are resolved once.
+        with django_assert_num_queries(0):
+            assert widget.value_from_datadict(data, {}, "tags") == values
+        with django_assert_num_queries(4):
+            assert widget.value_from_datadict(dict(data), {}, "tags") == values
+
+    def test_resolve_tags__once_per_submission(self, monkeypatch, genres):
+        class TagForm(django_forms.Form):
+            tags = django_forms.ModelMultipleChoiceField(
+                queryset=Genre.objects.all(),
+                widget=ModelSelect2TagWidget(
+                    search_fields=["title__icontains"], natural_key_field="title"
+                ),
+            )
+
+        calls = []
+        resolve_tags = ModelSelect2TagWidget.resolve_tags
+        monkeypatch.setattr(
+            ModelSelect2TagWidget,
+            "resolve_tags",
+            lambda widget, values: calls.append(values) or resolve_tags(widget, values),
+        )
+        form = TagForm(data=MultiValueDict({"tags": ["a", "b", "c"]}))
+        assert form.is_valid()
+        assert form.has_changed()
+        output = form.as_p()
+        assert len(calls) == 1
+        assert Genre.objects.filter(title__in=["a", "b", "c"]).count() == 3
+        assert "selected>c</option>" in output
+
+    def test_resolve_tags__numeric_title(self, genres):
+        widget = ModelSelect2TagWidget(
+            queryset=Genre.objects.all(),
+            search_fields=["title__icontains"],
+            natural_key_field="title",
+        )
+        (value,) = widget.resolve_tags(["999999"])
+        assert Genre.objects.get(pk=value).title == "999999"
+
+    def test_resolve_tags__to_field_name(self, genres):
+        field = django_forms.ModelMultipleChoiceField(
+            queryset=Genre.objects.all(),
+            to_field_name="title",
+            widget=ModelSelect2TagWidget(
+                search_fields=["title__icontains"], natural_key_field="title"
+            ),
+        )
+        assert field.widget.resolve_tags([genres[0].title, "new"]) == [
+            genres[0].title,
+            "new",
+        ]
+        assert field.clean([genres[0].title, "new"]).count() == 2
+
+
+class TestModelSelect2LazyMultiple:
+    def get_field(self, **kwargs):
+        return ModelSelect2LazyMultipleField(
+            queryset=Genre.objects.all(),
+            widget=ModelSelect2LazyMultipleWidget(search_fields=["title__icontains"]),
+            **kwargs,
+        )
+
+    def test_render(self, django_assert_num_queries, genres):
+        field = self.get_field()
+        with django_assert_num_queries(0):
+            output = field.widget.render("genres", [g.pk for g in genres[:3]])
+        assert 'data-lazy-labels="true"' in output
+        assert 'data-label-batch-size="100"' in output
+        for genre in genres[:3]:
+            assert (
+                '<option value="%d" selected>%d</option>' % (genre.pk, genre.pk)
+                in output
+            )
+            assert genre.title not in output
+
+    def test_clean(self, django_assert_num_queries, genres):
+        field = self.get_field(chunk_size=2)
+        values = [str(g.pk) for g in genres[:5]]
+        with django_assert_num_queries(3):
+            instances = field.clean(values + values[:1])
+        assert sorted(obj.pk for obj in instances) == sorted(g.pk for g in genres[:5])
+
+    def test_clean__invalid_choice(self, genres):
+        field = self.get_field(chunk_size=2)
+        with pytest.raises(django_forms.ValidationError) as exc_info:
+            field.clean([str(genres[0].pk), "999999"])
+        assert exc_info.value.code == "invalid_choice"
+
+    def test_clean__invalid_pk_value(self, genres):
+        field = self.get_field()
+        with pytest.raises(django_forms.ValidationError) as exc_info:
+            field.clean([str(genres[0].pk), "foo"])
+        assert exc_info.value.code == "invalid_pk_value"
+
+    def test_clean__to_field_name(self, genres):
+        field = self.get_field(to_field_name="title")
+        (instance,) = field.clean([genres[0].title])
+        assert instance == genres[0]
+
 
 class TestHeavySelect2MultipleWidget:
     url = reverse("heavy_select2_multiple_widget")
@@ -708,3 +1018,17 @@ class TestAddressChainedSelect2Widget:
             )
         )
         assert city2_container.text == ""
+
+
+def test_import_does_not_load_admin():
+    code = (
+        "import sys, django; django.setup(); "
+        "import django_select2.forms, django_select2.views; "
+        "print('django.contrib.admin' in sys.modules)"
+    )
+    output = subprocess.check_output(
+        [sys.executable, "-c", code],
+        env=dict(os.environ, DJANGO_SETTINGS_MODULE="tests.testapp.settings"),
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    assert output.strip() == b"False"
@@ -0,0 +1,114 @@
+import pytest
+from django.urls import reverse
+
+from django_select2 import metrics
+from django_select2.forms import ModelSelect2Widget
+from django_select2.metrics import BaseCollector, InMemoryCollector
+from tests.testapp.models import Genre
+
+WIDGET_TAG = (("widget", "django_select2.forms.ModelSelect2Widget"),)
+
+
+class ListCollector(BaseCollector):
+    def __init__(self):
+        self.events = []
+
+    def increment(self, name, value=1, **tags):
+        self.events.append(("increment", name, value, tags))
+
+    def observe(self, name, value, **tags):
+        self.events.append(("observe", name, value, tags))
+
+
+@pytest.fixture
+def collector():
+    collector = metrics.get_collector()
+    collector.reset()
+    return collector
+
+
+class TestInMemoryCollector:
+    def test_increment(self):
+        collector = InMemoryCollector()
+        collector.increment("lookup")
+        collector.increment("lookup", 2)
+        collector.increment("lookup", widget="MyWidget")
+        assert collector.counters == {
+            ("lookup", ()): 3,
+            ("lookup", (("widget", "MyWidget"),)): 1,
+        }
+
+    def test_observe(self):
+        collector = InMemoryCollector()
+        collector.observe("lookup.latency", 0.02)
+        collector.observe("lookup.latency", 0.2)
+        collector.observe("lookup.latency", 20)
+        histogram = collector.histograms[("lookup.latency", ())]
+        assert histogram["count"] == 3
+        assert histogram["sum"] == pytest.approx(20.22)
+        assert histogram["buckets"][0.025] == 1
+        assert histogram["buckets"][0.25] == 1
+        assert histogram["buckets"][float("inf")] == 1
+
+    def test_reset(self):
+        collector = InMemoryCollector()
+        collector.increment("lookup")
+        collector.observe("lookup.results", 1)
+        collector.reset()
+        assert collector.counters == {}
+        assert collector.histograms == {}
+
+
+class TestMetrics:
+    def test_custom_collector(self, settings):
+        settings.SELECT2_METRICS_COLLECTOR = "tests.test_metrics.ListCollector"
+        metrics.increment("lookup", widget="MyWidget")
+        metrics.observe("lookup.results", 5)
+        assert metrics.get_collector().events == [
+            ("increment", "lookup", 1, {"widget": "MyWidget"}),
+            ("observe", "lookup.results", 5, {}),
+        ]
+
+    def test_disabled(self, settings):
+        settings.SELECT2_METRICS_COLLECTOR = None
+        assert metrics.get_collector() is None
+        metrics.increment("lookup")
+        metrics.observe("lookup.results", 5)
+
+    def test_registry_write(self, collector, settings):
+        settings.SELECT2_REGISTRY_MAX_SIZE = 1024 * 1024
+        widget = ModelSelect2Widget(model=Genre, search_fields=["title__icontains"])
+        widget.render("name", None)
+        assert collector.counters[("registry.write", WIDGET_TAG)] == 1
+        histogram = collector.histograms[("registry.write_bytes", WIDGET_TAG)]
+        assert histogram["count"] == 1
+        assert histogram["sum"] > 0
+
+    def test_registry_write__size_not_measured(self, collector):
+        widget = ModelSelect2Widget(model=Genre, search_fields=["title__icontains"])
+        widget.render("name", None)
+        assert collector.counters[("registry.write", WIDGET_TAG)] == 1
+        assert ("registry.write_bytes", WIDGET_TAG) not in collector.histograms
+
+    def test_lookup(self, client, genres, collector):
+        widget = ModelSelect2Widget(
+            model=Genre, search_fields=["title__icontains"], max_results=10
+        )
+        widget.render("name", None)
+        url = reverse("django_select2:auto-json")
+        response = client.get(url, {"field_id": widget.field_id, "term": ""})
+        assert response.status_code == 200
+        assert collector.counters[("registry.hit", WIDGET_TAG)] == 1
+        assert collector.counters[("lookup", WIDGET_TAG)] == 1
+        assert collector.histograms[("lookup.results", WIDGET_TAG)]["sum"] == 10
+        assert collector.histograms[("lookup.latency", WIDGET_TAG)]["count"] == 1
+
+    def test_registry_errors(self, client, db, collector):
+        url = reverse("django_select2:auto-json")
+        assert client.get(url, {"field_id": "forged"}).status_code == 404
+        assert collector.counters[("registry.invalid_signature", ())] == 1
+
+        widget = ModelSelect2Widget(model=Genre, search_fields=["title__icontains"])
+        response = client.get(url, {"field_id": widget.field_id})
+        assert response.status_code == 404
+        assert collector.counters[("registry.miss", ())] == 1
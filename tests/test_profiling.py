@@ -0,0 +1,90 @@
+import json
+import os
+
+import pytest
+from django.urls import reverse
+
+from django_select2 import profiling
+from django_select2.forms import ModelSelect2Widget
+from tests.testapp.models import Genre
+
+WIDGET_TAG = "django_select2.forms.ModelSelect2Widget"
+
+
+@pytest.fixture
+def profile_dir(tmp_path, settings):
+    settings.SELECT2_PROFILE_DIR = str(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def field_id(genres):
+    widget = ModelSelect2Widget(
+        queryset=Genre.objects.all(), search_fields=["title__icontains"]
+    )
+    widget.render("genre", None)
+    return widget.field_id
+
+
+def test_disabled(client, field_id, profile_dir):
+    url = reverse("django_select2:auto-json")
+    response = client.get(url, {"field_id": field_id})
+    assert response.status_code == 200
+    assert not os.listdir(str(profile_dir))
+
+
+def test_sample(client, field_id, profile_dir, settings):
+    settings.SELECT2_PROFILE_RATE = 3
+    url = reverse("django_select2:auto-json")
+    for _ in range(6):
+        assert client.get(url, {"field_id": field_id}).status_code == 200
+
+    files = sorted(os.listdir(str(profile_dir / WIDGET_TAG)))
+    assert len(files) == 4
+    assert sum(name.endswith(".prof") for name in files) == 2
+    with open(str(profile_dir / WIDGET_TAG / files[0])) as f:
+        profile = json.load(f)
+    assert profile["path"] == url
+    assert "field_id=" in profile["query_string"]
+    assert profile["error"] is None
+    assert profile["duration"] > 0
+    assert len(profile["queries"]) == 2
+    assert all(query["alias"] == "default" for query in profile["queries"])
+
+
+def test_sample__not_found(client, db, profile_dir, settings):
+    settings.SELECT2_PROFILE_RATE = 1
+    url = reverse("django_select2:auto-json")
+    assert client.get(url).status_code == 404
+    files = os.listdir(str(profile_dir / "unknown"))
+    assert len(files) == 2
+    name = next(name for name in files if name.endswith(".json"))
+    with open(str(profile_dir / "unknown" / name)) as f:
+        assert json.load(f)["error"] == "Http404"
+
+
+def test_sample__dump_error(client, field_id, tmp_path, settings, caplog):
+    settings.SELECT2_PROFILE_RATE = 1
+    settings.SELECT2_PROFILE_DIR = str(tmp_path / "file")
+    (tmp_path / "file").write_text("not a directory")
+    url = reverse("django_select2:auto-json")
+    assert client.get(url, {"field_id": field_id}).status_code == 200
+    assert client.get(url).status_code == 404
+    records = [r for r in caplog.records if r.name == "django_select2.profiling"]
+    assert [r.message for r in records] == [
+        "Could not write the profile of a request."
+    ] * 2
+
+
+def test_aggregate(client, field_id, profile_dir, settings):
+    settings.SELECT2_PROFILE_RATE = 1
+    url = reverse("django_select2:auto-json")
+    for term in ("a", "b"):
+        client.get(url, {"field_id": field_id, "term": term})
+
+    profiles = profiling.aggregate()
+    assert list(profiles) == [WIDGET_TAG]
+    profile = profiles[WIDGET_TAG]
+    assert profile["requests"] == 2
+    assert profile["stats"].total_calls > 0
+    assert sum(query["count"] for query in profile["queries"].values()) == 4
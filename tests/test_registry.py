@@ -0,0 +1,431 @@
+import datetime
+import json
+import time
+
+import pytest
+from django.core import signing
+from django.db.models import QuerySet
+from django.urls import reverse
+from django.utils import timezone
+
+from django_select2 import metrics
+from django_select2.cache import cache
+from django_select2.forms import HeavySelect2Widget, ModelSelect2Widget
+from django_select2.models import WidgetRegistration
+from django_select2.registry import (
+    TOKEN_PREFIX,
+    TOKEN_SALT,
+    CacheRegistry,
+    Compressed,
+    DatabaseRegistry,
+    RegistryPayloadTooLarge,
+    SpecPointer,
+    dumps_token,
+    get_registry,
+    is_token,
+    loads_token,
+)
+from tests.testapp.models import Genre
+
+
+@pytest.fixture
+def database_registry(settings):
+    settings.SELECT2_REGISTRY_BACKEND = "django_select2.registry.DatabaseRegistry"
+    return get_registry()
+
+
+def test_get_registry(settings):
+    assert isinstance(get_registry(), CacheRegistry)
+    settings.SELECT2_REGISTRY_BACKEND = "django_select2.registry.DatabaseRegistry"
+    assert isinstance(get_registry(), DatabaseRegistry)
+
+
+class TestCacheRegistry:
+    def test_set_get(self):
+        registry = CacheRegistry()
+        registry.set("select2_key", {"a": 1})
+        assert cache.get("select2_key") == {"a": 1}
+        assert registry.get("select2_key") == {"a": 1}
+        assert registry.get("select2_missing") is None
+        assert registry.purge() == 0
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return "replica"
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+
+class TestDatabaseRegistry:
+    @pytest.mark.django_db(databases=["default", "replica"])
+    def test_set_get__replica(self, settings):
+        settings.DATABASE_ROUTERS = ["tests.test_registry.ReplicaRouter"]
+        registry = DatabaseRegistry()
+        registry.set("key", {"a": 1})
+        registry.set("key", {"a": 2})
+        assert registry.get("key") == {"a": 2}
+        assert registry.touch("key")
+        assert WidgetRegistration.objects.using("default").count() == 1
+        assert not WidgetRegistration.objects.using("replica").exists()
+
+    def test_set_get(self, db):
+        registry = DatabaseRegistry()
+        registry.set("key", {"a": 1})
+        assert registry.get("key") == {"a": 1}
+        assert registry.get("missing") is None
+
+    def test_set__upsert(self, db):
+        registry = DatabaseRegistry()
+        registry.set("key", {"a": 1})
+        registry.set("key", {"a": 2})
+        assert WidgetRegistration.objects.count() == 1
+        assert registry.get("key") == {"a": 2}
+
+    def test_set__update_first(self, db, django_assert_num_queries):
+        registry = DatabaseRegistry()
+        registry.set("key", {"a": 1})
+        with django_assert_num_queries(1) as captured:
+            registry.set("key", {"a": 2})
+        assert captured.captured_queries[0]["sql"].startswith("UPDATE")
+
+    def test_set__race(self, db, monkeypatch):
+        registry = DatabaseRegistry()
+        registry.set("key", {"a": 1})
+        update = QuerySet.update
+        calls = []
+
+        def racing_update(queryset, **kwargs):
+            # The row appears to be missing on the first update.
+            calls.append(kwargs)
+            return update(queryset, **kwargs) if len(calls) > 1 else 0
+
+        monkeypatch.setattr(QuerySet, "update", racing_update)
+        registry.set("key", {"a": 2})
+        monkeypatch.undo()
+        assert len(calls) == 2
+        assert registry.get("key") == {"a": 2}
+
+    def test_get__expired(self, db):
+        registry = DatabaseRegistry()
+        registry.set("key", {"a": 1})
+        WidgetRegistration.objects.update(
+            expires=timezone.now() - datetime.timedelta(seconds=1)
+        )
+        assert registry.get("key") is None
+
+    def test_get__primary_key_lookup(self, db, django_assert_num_queries):
+        registry = DatabaseRegistry()
+        registry.set("key", {"a": 1})
+        with django_assert_num_queries(1) as captured:
+            registry.get("key")
+        assert '"key" = ' in captured.captured_queries[0]["sql"]
+
+    def test_purge(self, db):
+        registry = DatabaseRegistry()
+        registry.batch_size = 3
+        for i in range(10):
+            registry.set("key%d" % i, i)
+        WidgetRegistration.objects.filter(key__in=["key0", "key1"]).update(
+            expires=timezone.now() + datetime.timedelta(days=1)
+        )
+        WidgetRegistration.objects.exclude(key__in=["key0", "key1"]).update(
+            expires=timezone.now() - datetime.timedelta(seconds=1)
+        )
+        assert registry.purge() == 8
+        assert set(WidgetRegistration.objects.values_list("key", flat=True)) == {
+            "key0",
+            "key1",
+        }
+        assert registry.purge() == 0
+
+    def test_autocomplete(self, client, genres, database_registry):
+        widget = ModelSelect2Widget(
+            queryset=Genre.objects.all(), search_fields=["title__icontains"]
+        )
+        widget.render("genre", None)
+        assert WidgetRegistration.objects.filter(pk=widget._get_cache_key()).exists()
+        assert cache.get(widget._get_cache_key()) is None
+
+        url = reverse("django_select2:auto-json")
+        response = client.get(url, {"field_id": widget.field_id})
+        assert response.status_code == 200
+        data = json.loads(response.content.decode("utf-8"))
+        assert len(data["results"]) == widget.max_results
+
+
+class TestCompression:
+    @pytest.fixture
+    def widget(self, db):
+        return ModelSelect2Widget(
+            queryset=Genre.objects.filter(title__in=["x" * 100 for _ in range(50)]),
+            search_fields=["title__icontains"],
+        )
+
+    @pytest.mark.parametrize("algorithm", ["zlib", "lzma"])
+    def test_compress(self, client, settings, widget, algorithm):
+        settings.SELECT2_REGISTRY_COMPRESS_THRESHOLD = 100
+        settings.SELECT2_REGISTRY_COMPRESSION = algorithm
+        widget.render("genre", None)
+        payload = cache.get(widget._get_cache_key())
+        assert isinstance(payload, Compressed)
+        assert payload.algorithm == algorithm
+        assert get_registry().get(widget._get_cache_key())["search_fields"] == (
+            "title__icontains",
+        )
+
+        url = reverse("django_select2:auto-json")
+        response = client.get(url, {"field_id": widget.field_id})
+        assert response.status_code == 200
+
+    def test_compress__below_threshold(self, settings, widget):
+        settings.SELECT2_REGISTRY_COMPRESS_THRESHOLD = 1024 * 1024
+        widget.render("genre", None)
+        assert isinstance(cache.get(widget._get_cache_key()), dict)
+
+    def test_compress__database_registry(self, settings, widget, database_registry):
+        settings.SELECT2_REGISTRY_COMPRESS_THRESHOLD = 100
+        widget.render("genre", None)
+        assert database_registry.get(widget._get_cache_key())["max_results"] == 25
+        (entry,) = database_registry.scan()
+        assert entry.widget == "django_select2.forms.ModelSelect2Widget"
+
+    def test_compression_ratio(self, settings, widget):
+        settings.SELECT2_REGISTRY_COMPRESS_THRESHOLD = 100
+        collector = metrics.get_collector()
+        collector.reset()
+        widget.render("genre", None)
+        tags = (("widget", "django_select2.forms.ModelSelect2Widget"),)
+        ratio = collector.histograms[("registry.compression_ratio", tags)]
+        assert ratio["count"] == 1
+        assert ratio["sum"] > 1
+
+    def test_max_size(self, settings, widget):
+        settings.SELECT2_REGISTRY_MAX_SIZE = 100
+        with pytest.raises(RegistryPayloadTooLarge) as e:
+            widget.render("genre", None)
+        assert "django_select2.forms.ModelSelect2Widget" in str(e.value)
+        assert cache.get(widget._get_cache_key()) is None
+
+    def test_max_size__compressed(self, settings, widget):
+        settings.SELECT2_REGISTRY_COMPRESS_THRESHOLD = 100
+        settings.SELECT2_REGISTRY_MAX_SIZE = 2000
+        widget.render("genre", None)
+        assert isinstance(cache.get(widget._get_cache_key()), Compressed)
+
+    def test_max_size__warning(self, settings, widget, caplog):
+        settings.SELECT2_REGISTRY_MAX_SIZE = 100
+        settings.SELECT2_REGISTRY_MAX_SIZE_ACTION = "warning"
+        widget.render("genre", None)
+        assert "SELECT2_REGISTRY_MAX_SIZE" in caplog.text
+        assert cache.get(widget._get_cache_key()) is not None
+
+
+class TestDeduplication:
+    @pytest.fixture(autouse=True)
+    def deduplicate(self, settings):
+        settings.SELECT2_REGISTRY_DEDUPLICATE = True
+        cache.clear()
+
+    def render(self, count, queryset):
+        widgets = []
+        for _ in range(count):
+            widget = ModelSelect2Widget(
+                queryset=queryset, search_fields=["title__icontains"]
+            )
+            widget.render("genre", None)
+            widgets.append(widget)
+        return widgets
+
+    def test_spec(self, client, genres):
+        widgets = self.render(5, Genre.objects.all())
+        pointers = {cache.get(widget._get_cache_key()) for widget in widgets}
+        assert len(pointers) == 1
+        (pointer,) = pointers
+        assert isinstance(pointer, SpecPointer)
+        assert pointer.widget == "django_select2.forms.ModelSelect2Widget"
+        assert cache.get(pointer.key)["search_fields"] == ("title__icontains",)
+
+        url = reverse("django_select2:auto-json")
+        for widget, term in zip(widgets, ["", genres[0].title]):
+            response = client.get(url, {"field_id": widget.field_id, "term": term})
+            assert response.status_code == 200
+        data = json.loads(response.content.decode("utf-8"))
+        assert data["results"] == [{"id": genres[0].pk, "text": genres[0].title}]
+
+    def test_spec__heavy_widget(self, db):
+        widgets = [HeavySelect2Widget(data_view="heavy_data_1") for _ in range(3)]
+        for widget in widgets:
+            widget.render("name", None)
+        for widget in widgets:
+            value = cache.get(widget._get_cache_key())
+            assert not isinstance(value, SpecPointer)
+            assert value["widget"].uuid == widget.uuid
+        assert not [key for key in cache._cache if "spec_" in key]
+
+    def test_spec__distinct(self, db):
+        widgets = self.render(2, Genre.objects.all()) + self.render(
+            2, Genre.objects.filter(pk__gt=10)
+        )
+        pointers = {cache.get(widget._get_cache_key()) for widget in widgets}
+        assert len(pointers) == 2
+
+    def test_spec__written_once(self, db):
+        collector = metrics.get_collector()
+        collector.reset()
+        self.render(3, Genre.objects.all())
+        assert collector.counters[("registry.spec_write", ())] == 1
+        assert collector.counters[("registry.spec_hit", ())] == 2
+
+    def test_spec__rewritten_after_eviction(self, db):
+        (widget,) = self.render(1, Genre.objects.all())
+        cache.delete(cache.get(widget._get_cache_key()).key)
+        (other,) = self.render(1, Genre.objects.all())
+        assert cache.get(cache.get(other._get_cache_key()).key) is not None
+
+    def test_spec__local_cache(self, db):
+        registry = get_registry()
+        widget, other = self.render(2, Genre.objects.all())
+        spec = registry.get(widget._get_cache_key())
+        spec.pop("url")
+        cache.delete(cache.get(widget._get_cache_key()).key)
+        assert registry.get(other._get_cache_key())["url"] == widget.get_url()
+
+    def test_spec__database_registry(self, client, genres, database_registry):
+        widgets = self.render(3, Genre.objects.all())
+        assert WidgetRegistration.objects.count() == 4
+        url = reverse("django_select2:auto-json")
+        response = client.get(url, {"field_id": widgets[-1].field_id})
+        assert response.status_code == 200
+
+    def test_spec__written_after_pointer(self, db, monkeypatch):
+        registry = get_registry()
+        keys = []
+
+        def write(key, payload):
+            keys.append(key)
+            type(registry).write(registry, key, payload)
+
+        def touch(key):
+            keys.append(key)
+            return type(registry).touch(registry, key)
+
+        monkeypatch.setattr(registry, "write", write)
+        monkeypatch.setattr(registry, "touch", touch)
+        widget, other = self.render(2, Genre.objects.all())
+        spec_key = cache.get(widget._get_cache_key()).key
+        # The spec is touched, then written if it was missing.
+        assert keys == [
+            widget._get_cache_key(),
+            spec_key,
+            spec_key,
+            other._get_cache_key(),
+            spec_key,
+        ]
+
+
+class TestStatelessTokens:
+    @pytest.fixture(autouse=True)
+    def stateless_tokens(self, settings):
+        settings.SELECT2_STATELESS_TOKENS = True
+
+    def render(self, queryset=None):
+        widget = ModelSelect2Widget(
+            queryset=queryset if queryset is not None else Genre.objects.all(),
+            search_fields=["title__icontains"],
+        )
+        output = widget.render("genre", None)
+        assert 'data-field_id="%s"' % widget.field_id in output
+        return widget
+
+    def test_token(self, client, genres, monkeypatch):
+        widget = self.render()
+        assert is_token(widget.field_id)
+        assert cache.get(widget._get_cache_key()) is None
+        assert loads_token(widget.field_id)["search_fields"] == ["title__icontains"]
+
+        def fail(key):
+            raise AssertionError("The registry must not be accessed.")
+
+        monkeypatch.setattr(get_registry(), "get", fail)
+        url = reverse("django_select2:auto-json")
+        response = client.get(
+            url, {"field_id": widget.field_id, "term": genres[0].title}
+        )
+        assert response.status_code == 200
+        data = json.loads(response.content.decode("utf-8"))
+        assert data["results"] == [{"id": genres[0].pk, "text": genres[0].title}]
+
+    def test_token__too_large(self, client, genres, settings):
+        settings.SELECT2_STATELESS_TOKEN_MAX_SIZE = 10
+        widget = self.render()
+        assert not is_token(widget.field_id)
+        assert cache.get(widget._get_cache_key()) is not None
+        url = reverse("django_select2:auto-json")
+        response = client.get(url, {"field_id": widget.field_id})
+        assert response.status_code == 200
+
+    def test_token__json(self, genres):
+        widget = self.render()
+        data = signing.loads(widget.field_id[len(TOKEN_PREFIX) :], salt=TOKEN_SALT)
+        assert data["cls"] == "django_select2.forms.ModelSelect2Widget"
+        assert data["model"] == "testapp.Genre"
+
+    def test_token__filtered_queryset(self, client, genres):
+        widget = self.render(Genre.objects.filter(title="secret-tenant-42"))
+        assert not is_token(widget.field_id)
+        assert cache.get(widget._get_cache_key()) is not None
+        assert "secret-tenant-42" not in widget.render("genre", None)
+
+    def test_token__heavy_widget(self):
+        widget = HeavySelect2Widget(data_view="heavy_data_1")
+        field_ids = set()
+        for _ in range(3):
+            widget.render("number", None)
+            field_ids.add(widget.field_id)
+        assert len(field_ids) == 1
+        assert not is_token(widget.field_id)
+
+    def test_token__rerender(self, genres):
+        widget = self.render()
+        tokens = set()
+        for _ in range(3):
+            widget.render("genre", None)
+            tokens.add(len(widget.field_id))
+        assert tokens == {len(widget.field_id)}
+
+    def test_token__expired(self, client, genres, monkeypatch):
+        widget = self.render()
+        now = time.time()
+        monkeypatch.setattr(time, "time", lambda: now + get_registry().timeout + 1)
+        url = reverse("django_select2:auto-json")
+        response = client.get(url, {"field_id": widget.field_id})
+        assert response.status_code == 404
+
+    def test_token__tampered(self, client, genres):
+        widget = self.render()
+        url = reverse("django_select2:auto-json")
+        forged = TOKEN_PREFIX + signing.dumps(
+            {"cls": "os.system", "model": "testapp.Genre", "db": None, "url": url},
+            salt=TOKEN_SALT,
+        )
+        for field_id in (widget.field_id[:-1], widget.field_id[:20], forged):
+            response = client.get(url, {"field_id": field_id})
+            assert response.status_code == 404
+
+    def test_token__url_mismatch(self, client, genres):
+        widget = self.render()
+        widget_dict = loads_token(widget.field_id)
+        widget_dict["url"] = "/other/"
+        url = reverse("django_select2:auto-json")
+        response = client.get(url, {"field_id": dumps_token(widget_dict)})
+        assert response.status_code == 404
+
+    def test_token__metrics(self, genres):
+        collector = metrics.get_collector()
+        collector.reset()
+        self.render()
+        tags = (("widget", "django_select2.forms.ModelSelect2Widget"),)
+        assert collector.counters[("registry.token", tags)] == 1
+        assert ("registry.write", tags) not in collector.counters
@@ -0,0 +1,92 @@
+import json
+import time
+
+import pytest
+from django.db import connection
+from django.urls import reverse
+
+from django_select2 import metrics
+from django_select2.forms import ModelSelect2Widget
+from django_select2.timeouts import QueryTimeout, statement_timeout
+from tests.testapp.models import Genre
+
+SLOW_SQL = (
+    "(WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c"
+    " WHERE x < 100000000) SELECT count(*) FROM c) > 0"
+)
+
+
+class SlowGenreWidget(ModelSelect2Widget):
+    search_fields = ["title__icontains"]
+
+    def filter_queryset(self, request, term, queryset=None, **dependent_fields):
+        queryset = super().filter_queryset(
+            request, term, queryset=queryset, **dependent_fields
+        )
+        return queryset.extra(where=[SLOW_SQL])
+
+
+def test_statement_timeout(genres):
+    start = time.monotonic()
+    with pytest.raises(QueryTimeout):
+        with statement_timeout(0.05):
+            list(Genre.objects.extra(where=[SLOW_SQL]))
+    assert time.monotonic() - start < 5
+    assert Genre.objects.count() == len(genres)
+
+
+def test_statement_timeout__deadline(db):
+    with pytest.raises(QueryTimeout):
+        with statement_timeout(0.01):
+            Genre.objects.count()
+            time.sleep(0.02)
+            Genre.objects.count()
+
+
+def test_statement_timeout__disabled(db):
+    with statement_timeout(None):
+        assert Genre.objects.count() == 0
+
+
+def test_statement_timeout__other_errors(db):
+    with pytest.raises(Exception) as exc_info:
+        with statement_timeout(10):
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT * FROM does_not_exist")
+    assert not isinstance(exc_info.value, QueryTimeout)
+
+
+def test_view(client, genres, settings):
+    collector = metrics.get_collector()
+    collector.reset()
+    widget = SlowGenreWidget(queryset=Genre.objects.all(), query_timeout=0.05)
+    widget.render("genre", None)
+    url = reverse("django_select2:auto-json")
+    response = client.get(url, {"field_id": widget.field_id})
+    assert response.status_code == 200
+    data = json.loads(response.content.decode("utf-8"))
+    assert data == {"results": [], "more": False, "timed_out": True}
+    tags = (("widget", "tests.test_timeouts.SlowGenreWidget"),)
+    assert collector.counters[("lookup.timeout", tags)] == 1
+
+
+def test_view__setting(client, genres, settings):
+    settings.SELECT2_QUERY_TIMEOUT = 0.05
+    widget = SlowGenreWidget(queryset=Genre.objects.all())
+    widget.render("genre", None)
+    url = reverse("django_select2:auto-json")
+    response = client.get(url, {"field_id": widget.field_id})
+    assert json.loads(response.content.decode("utf-8"))["timed_out"] is True
+
+
+def test_view__in_time(client, genres, settings):
+    settings.SELECT2_QUERY_TIMEOUT = 10
+    widget = ModelSelect2Widget(
+        queryset=Genre.objects.all(), search_fields=["title__icontains"]
+    )
+    widget.render("genre", None)
+    url = reverse("django_select2:auto-json")
+    response = client.get(url, {"field_id": widget.field_id})
+    data = json.loads(response.content.decode("utf-8"))
+    assert data["results"]
+    assert "timed_out" not in data
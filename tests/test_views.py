@@ -1,11 +1,28 @@
+import itertools
 import json
+import os
+import threading
+import time
 
+import pytest
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.http import Http404
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
 from django.utils.encoding import smart_str
 
+from django_select2 import metrics, signals
 from django_select2.cache import cache
-from django_select2.forms import ModelSelect2Widget
+from django_select2.forms import (
+    ModelSelect2LazyMultipleField,
+    ModelSelect2LazyMultipleWidget,
+    ModelSelect2Widget,
+)
+from django_select2.views import HeavyResponseView
+from tests.test_timeouts import SLOW_SQL
 from tests.testapp.forms import AlbumModelSelect2WidgetForm, ArtistCustomTitleWidget
-from tests.testapp.models import Genre
+from tests.testapp.models import Album, Artist, Genre
 
 try:
     from django.urls import reverse
@@ -13,6 +30,60 @@ except ImportError:
     from django.core.urlresolvers import reverse
 
 
+class AlbumArtistWidget(ModelSelect2Widget):
+    search_fields = ["title__icontains"]
+
+    def label_from_instance(self, obj):
+        return "%s - %s" % (obj.title, obj.artist.title)
+
+
+class ArtistGenresWidget(ModelSelect2Widget):
+    search_fields = ["title__icontains"]
+
+    def label_from_instance(self, obj):
+        return ", ".join(genre.title for genre in obj.genres.all())
+
+
+class SmallBatchLazyWidget(ModelSelect2LazyMultipleWidget):
+    search_fields = ["title__icontains"]
+    label_batch_size = 2
+
+
+class EvenGenresLazyWidget(ModelSelect2LazyMultipleWidget):
+    search_fields = ["title__icontains"]
+
+    def filter_queryset(self, request, term, queryset=None, **dependent_fields):
+        queryset = super().filter_queryset(
+            request, term, queryset=queryset, **dependent_fields
+        )
+        return queryset.filter(pk__in=range(0, 100, 2))
+
+
+class BlockingGenreWidget(ModelSelect2Widget):
+    search_fields = ["title__icontains"]
+    started = threading.Event()
+    release = threading.Event()
+    calls = 0
+
+    def filter_queryset(self, request, term, queryset=None, **dependent_fields):
+        BlockingGenreWidget.calls += 1
+        BlockingGenreWidget.started.set()
+        BlockingGenreWidget.release.wait(5)
+        return super().filter_queryset(
+            request, term, queryset=queryset, **dependent_fields
+        )
+
+
+class SlowLazyWidget(ModelSelect2LazyMultipleWidget):
+    search_fields = ["title__icontains"]
+
+    def filter_queryset(self, request, term, queryset=None, **dependent_fields):
+        queryset = super().filter_queryset(
+            request, term, queryset=queryset, **dependent_fields
+        )
+        return queryset.extra(where=[SLOW_SQL])
+
+
 class TestAutoResponseView:
     def test_get(self, client, artists):
         artist = artists[0]
@@ -96,3 +167,411 @@ class TestAutoResponseView:
         url = reverse("django_select2:auto-json")
         response = client.get(url, {"field_id": field_id, "term": artist.title})
         assert response.status_code == 404
+
+    def test_throttle(self, client, artists, settings):
+        settings.SELECT2_THROTTLE_RATE = 0.1
+        settings.SELECT2_THROTTLE_BURST = 2
+        form = AlbumModelSelect2WidgetForm()
+        assert form.as_p()
+        field_id = form.fields["artist"].widget.field_id
+        url = reverse("django_select2:auto-json")
+        for _ in range(2):
+            response = client.get(url, {"field_id": field_id, "term": ""})
+            assert response.status_code == 200
+        response = client.get(url, {"field_id": field_id, "term": ""})
+        assert response.status_code == 429
+        assert 0 < int(response["Retry-After"]) <= 10
+        assert json.loads(response.content.decode("utf-8")) == {
+            "results": [],
+            "more": False,
+        }
+
+        other_form = AlbumModelSelect2WidgetForm()
+        other_form.fields["artist"].widget = ArtistCustomTitleWidget()
+        assert other_form.as_p()
+        other_field_id = other_form.fields["artist"].widget.field_id
+        response = client.get(url, {"field_id": other_field_id, "term": ""})
+        assert response.status_code == 200
+
+    def test_throttle_disabled(self, client, artists):
+        form = AlbumModelSelect2WidgetForm()
+        assert form.as_p()
+        field_id = form.fields["artist"].widget.field_id
+        url = reverse("django_select2:auto-json")
+        for _ in range(20):
+            response = client.get(url, {"field_id": field_id, "term": ""})
+            assert response.status_code == 200
+
+    def test_coalesce_lookups(self, client, artists, settings):
+        settings.SELECT2_COALESCE_LOOKUPS = True
+        artist = artists[0]
+        form = AlbumModelSelect2WidgetForm()
+        assert form.as_p()
+        field_id = form.fields["artist"].widget.field_id
+        url = reverse("django_select2:auto-json")
+        response = client.get(url, {"field_id": field_id, "term": artist.title})
+        assert response.status_code == 200
+        data = json.loads(response.content.decode("utf-8"))
+        assert {"id": artist.pk, "text": artist.title.upper()} in data["results"]
+
+        response = client.get(url, {"field_id": "not-exists", "term": artist.title})
+        assert response.status_code == 404
+
+    def test_coalesce_lookups__overlapping(self, client, genres, settings, tmp_path):
+        settings.SELECT2_COALESCE_LOOKUPS = True
+        settings.SELECT2_SERVER_TIMING = True
+        settings.SELECT2_PROFILE_RATE = 1
+        settings.SELECT2_PROFILE_DIR = str(tmp_path)
+        collector = metrics.get_collector()
+        collector.reset()
+        widget = BlockingGenreWidget(queryset=Genre.objects.all())
+        widget.render("genre", None)
+        url = reverse("django_select2:auto-json")
+        params = {"field_id": widget.field_id, "term": ""}
+        responses = {}
+
+        def send_identical_lookup():
+            responses["waiter"] = Client().get(url, params)
+
+        def release():
+            # Send an identical lookup, while the first one is in flight.
+            assert BlockingGenreWidget.started.wait(5)
+            thread = threading.Thread(target=send_identical_lookup)
+            thread.start()
+            time.sleep(0.2)
+            BlockingGenreWidget.release.set()
+            thread.join()
+
+        thread = threading.Thread(target=release)
+        thread.start()
+        responses["leader"] = client.get(url, params)
+        thread.join()
+
+        assert BlockingGenreWidget.calls == 1
+        leader, waiter = responses["leader"], responses["waiter"]
+        assert leader.status_code == waiter.status_code == 200
+        assert leader.content == waiter.content
+        assert waiter["Server-Timing"].startswith("coalesce;dur=")
+        tags = (("widget", "tests.test_views.BlockingGenreWidget"),)
+        assert collector.counters[("lookup", tags)] == 2
+        assert collector.histograms[("lookup.latency", tags)]["count"] == 2
+        assert os.listdir(str(tmp_path)) == ["tests.test_views.BlockingGenreWidget"]
+
+    def test_ajax_delay(self, artists, settings):
+        # Debouncing happens in Select2's JavaScript, only the attribute is
+        # rendered by the server.
+        settings.SELECT2_AJAX_DELAY = 400
+        output = AlbumModelSelect2WidgetForm().as_p()
+        assert 'data-ajax--delay="400"' in output
+        widget = ModelSelect2Widget(
+            queryset=Genre.objects.all(),
+            search_fields=["title__icontains"],
+            attrs={"data-ajax--delay": 0},
+        )
+        assert 'data-ajax--delay="0"' in widget.render("genre", None)
+
+    def test_server_timing(self, client, artists, settings):
+        settings.SELECT2_SERVER_TIMING = True
+        form = AlbumModelSelect2WidgetForm()
+        assert form.as_p()
+        field_id = form.fields["artist"].widget.field_id
+        url = reverse("django_select2:auto-json")
+        response = client.get(url, {"field_id": field_id, "term": ""})
+        assert response.status_code == 200
+        phases = [
+            metric.split(";")[0] for metric in response["Server-Timing"].split(", ")
+        ]
+        assert phases == ["registry", "widget", "count", "query", "label", "json"]
+
+    def test_server_timing_disabled(self, client, artists):
+        form = AlbumModelSelect2WidgetForm()
+        assert form.as_p()
+        field_id = form.fields["artist"].widget.field_id
+        url = reverse("django_select2:auto-json")
+        response = client.get(url, {"field_id": field_id, "term": ""})
+        assert response.status_code == 200
+        assert not response.has_header("Server-Timing")
+
+    def test_timing_signals(self, client, artists):
+        events = []
+
+        def on_started(sender, view, phase, **kwargs):
+            events.append(("started", phase))
+
+        def on_finished(sender, view, phase, duration, **kwargs):
+            assert duration >= 0
+            events.append(("finished", phase))
+
+        def on_lookup_finished(sender, view, timings, **kwargs):
+            events.append(("lookup", sorted(timings)))
+
+        form = AlbumModelSelect2WidgetForm()
+        assert form.as_p()
+        field_id = form.fields["artist"].widget.field_id
+        url = reverse("django_select2:auto-json")
+        signals.lookup_phase_started.connect(on_started)
+        signals.lookup_phase_finished.connect(on_finished)
+        signals.lookup_finished.connect(on_lookup_finished)
+        try:
+            response = client.get(url, {"field_id": field_id, "term": ""})
+        finally:
+            signals.lookup_phase_started.disconnect(on_started)
+            signals.lookup_phase_finished.disconnect(on_finished)
+            signals.lookup_finished.disconnect(on_lookup_finished)
+        assert response.status_code == 200
+        assert events[:2] == [("started", "registry"), ("finished", "registry")]
+        assert events[-1] == (
+            "lookup",
+            ["count", "json", "label", "query", "registry", "widget"],
+        )
+
+    def test_select_related(self, client, artists):
+        Album.objects.bulk_create(
+            [
+                Album(title="Album %d" % i, artist=artist)
+                for i, artist in enumerate(artists)
+            ]
+        )
+        url = reverse("django_select2:auto-json")
+        widget = AlbumArtistWidget(
+            queryset=Album.objects.all(),
+            select_related=["artist"],
+            only=["title", "artist__title"],
+        )
+        widget.render("album", None)
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url, {"field_id": widget.field_id, "term": "Album"})
+        assert response.status_code == 200
+        data = json.loads(response.content.decode("utf-8"))
+        assert len(data["results"]) == widget.max_results
+        album = Album.objects.get(pk=data["results"][0]["id"])
+        assert data["results"][0]["text"] == "%s - %s" % (
+            album.title,
+            album.artist.title,
+        )
+        # count and page
+        assert len(queries) == 2
+        assert "artist" in queries[-1]["sql"]
+
+    def test_prefetch_related(self, client, artists, genres):
+        for artist in artists[:10]:
+            artist.genres.set(genres[:3])
+        url = reverse("django_select2:auto-json")
+        widget = ArtistGenresWidget(
+            queryset=Artist.objects.filter(pk__in=[a.pk for a in artists[:10]]),
+            prefetch_related=["genres"],
+        )
+        widget.render("artist", None)
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url, {"field_id": widget.field_id})
+        assert response.status_code == 200
+        data = json.loads(response.content.decode("utf-8"))
+        assert len(data["results"]) == 10
+        # count, page and genres
+        assert len(queries) == 3
+
+    @pytest.mark.django_db(databases=["default", "replica"])
+    def test_using(self, client):
+        Genre.objects.create(title="Primary")
+        genre = Genre.objects.using("replica").create(title="Replica")
+        widget = ModelSelect2Widget(
+            model=Genre, search_fields=["title__icontains"], using="replica"
+        )
+        widget.render("genre", None)
+        assert cache.get(widget._get_cache_key())["using"] == "replica"
+        url = reverse("django_select2:auto-json")
+        response = client.get(url, {"field_id": widget.field_id})
+        assert response.status_code == 200
+        data = json.loads(response.content.decode("utf-8"))
+        assert data["results"] == [{"id": genre.pk, "text": "Replica"}]
+
+    @pytest.mark.django_db(databases=["default", "replica"])
+    def test_using__setting(self, client, settings):
+        settings.SELECT2_DATABASE = "replica"
+        Genre.objects.create(title="Primary")
+        genre = Genre.objects.using("replica").create(title="Replica")
+        widget = ModelSelect2Widget(model=Genre, search_fields=["title__icontains"])
+        widget.render("genre", None)
+        url = reverse("django_select2:auto-json")
+        response = client.get(url, {"field_id": widget.field_id})
+        assert response.status_code == 200
+        data = json.loads(response.content.decode("utf-8"))
+        assert data["results"] == [{"id": genre.pk, "text": "Replica"}]
+
+    def test_labels(self, client, genres):
+        widget = ModelSelect2LazyMultipleWidget(
+            queryset=Genre.objects.exclude(pk=genres[2].pk),
+            search_fields=["title__icontains"],
+        )
+        widget.render("genres", None)
+        url = reverse("django_select2:auto-json")
+        ids = [genres[1].pk, genres[0].pk, genres[2].pk, 999999]
+        response = client.get(
+            url, {"field_id": widget.field_id, "ids": ",".join(map(str, ids))}
+        )
+        assert response.status_code == 200
+        data = json.loads(response.content.decode("utf-8"))
+        assert data == {
+            "results": [
+                {"id": genres[1].pk, "text": genres[1].title},
+                {"id": genres[0].pk, "text": genres[0].title},
+            ],
+            "more": False,
+        }
+
+    def test_labels__batch_size(self, client, genres):
+        widget = SmallBatchLazyWidget(queryset=Genre.objects.all())
+        widget.render("genres", None)
+        url = reverse("django_select2:auto-json")
+        ids = ",".join(str(genre.pk) for genre in genres)
+        response = client.get(url, {"field_id": widget.field_id, "ids": ids})
+        data = json.loads(response.content.decode("utf-8"))
+        assert [result["id"] for result in data["results"]] == [
+            genres[0].pk,
+            genres[1].pk,
+        ]
+
+    def test_labels__invalid(self, client, genres):
+        widget = ModelSelect2LazyMultipleWidget(
+            queryset=Genre.objects.all(), search_fields=["title__icontains"]
+        )
+        widget.render("genres", None)
+        url = reverse("django_select2:auto-json")
+        response = client.get(url, {"field_id": widget.field_id, "ids": "1,foo"})
+        assert response.status_code == 404
+
+    def test_labels__timeout(self, client, genres):
+        widget = SlowLazyWidget(queryset=Genre.objects.all(), query_timeout=0.05)
+        widget.render("genres", None)
+        url = reverse("django_select2:auto-json")
+        response = client.get(
+            url, {"field_id": widget.field_id, "ids": str(genres[0].pk)}
+        )
+        assert response.status_code == 200
+        data = json.loads(response.content.decode("utf-8"))
+        assert data == {"results": [], "more": False, "timed_out": True}
+
+    def test_labels__lazy_widget_only(self, client, genres):
+        widget = ModelSelect2Widget(
+            queryset=Genre.objects.all(), search_fields=["title__icontains"]
+        )
+        widget.render("genre", None)
+        url = reverse("django_select2:auto-json")
+        response = client.get(url, {"field_id": widget.field_id, "ids": "1"})
+        assert response.status_code == 404
+
+    def test_labels__filter_queryset(self, client, genres):
+        widget = EvenGenresLazyWidget(queryset=Genre.objects.all())
+        widget.render("genres", None)
+        url = reverse("django_select2:auto-json")
+        response = client.get(url, {"field_id": widget.field_id, "ids": "1,2,3,4"})
+        data = json.loads(response.content.decode("utf-8"))
+        assert [result["id"] for result in data["results"]] == [2, 4]
+
+    def test_labels__dependent_fields(self, client, artists):
+        albums = [
+            Album.objects.create(title="Album %d" % i, artist=artists[i % 2])
+            for i in range(4)
+        ]
+        widget = ModelSelect2LazyMultipleWidget(
+            queryset=Album.objects.all(),
+            search_fields=["title__icontains"],
+            dependent_fields={"artist": "artist"},
+        )
+        widget.render("albums", None)
+        url = reverse("django_select2:auto-json")
+        ids = ",".join(str(album.pk) for album in albums)
+        response = client.get(
+            url, {"field_id": widget.field_id, "ids": ids, "artist": artists[1].pk}
+        )
+        data = json.loads(response.content.decode("utf-8"))
+        assert [result["id"] for result in data["results"]] == [
+            albums[1].pk,
+            albums[3].pk,
+        ]
+
+    def test_labels__to_field_name(self, client, genres):
+        field = ModelSelect2LazyMultipleField(
+            queryset=Genre.objects.all(),
+            to_field_name="title",
+            widget=ModelSelect2LazyMultipleWidget(search_fields=["title__icontains"]),
+        )
+        titles = [genres[1].title, genres[0].title]
+        output = field.widget.render("genres", field.prepare_value(titles))
+        assert '<option value="%s" selected>' % genres[1].title in output
+        url = reverse("django_select2:auto-json")
+        response = client.get(
+            url, {"field_id": field.widget.field_id, "ids": ",".join(titles)}
+        )
+        data = json.loads(response.content.decode("utf-8"))
+        assert data["results"] == [{"id": title, "text": title} for title in titles]
+
+
+class TestHeavyResponseView:
+    def get(self, rf, view, **params):
+        response = view(rf.get("/numbers.json", params))
+        assert response.status_code == 200
+        return json.loads(response.content.decode("utf-8"))
+
+    def test_get(self, rf):
+        view = HeavyResponseView.as_view(
+            source=[(1, "One"), (2, "Two"), (3, "Three")], max_results=1
+        )
+        assert self.get(rf, view, term="T") == {
+            "results": [{"id": 2, "text": "Two"}],
+            "more": True,
+        }
+        assert self.get(rf, view, term="t", page=2) == {
+            "results": [{"id": 3, "text": "Three"}],
+            "more": False,
+        }
+        assert self.get(rf, view, term="on e") == {
+            "results": [{"id": 1, "text": "One"}],
+            "more": False,
+        }
+        with pytest.raises(Http404):
+            view(rf.get("/numbers.json", {"term": "t", "page": 3}))
+        with pytest.raises(Http404):
+            view(rf.get("/numbers.json", {"page": "foo"}))
+
+    def test_get__items(self, rf):
+        view = HeavyResponseView.as_view(
+            source=["Zero", {"id": "x", "text": "Ten"}], max_results=10
+        )
+        assert self.get(rf, view)["results"] == [
+            {"id": "Zero", "text": "Zero"},
+            {"id": "x", "text": "Ten"},
+        ]
+
+    def test_get__lazy(self, rf):
+        consumed = []
+
+        def source():
+            for number in itertools.count():
+                consumed.append(number)
+                yield number, "Number %d" % number
+
+        view = HeavyResponseView.as_view(source=source, max_results=10)
+        data = self.get(rf, view, term="1", page=2)
+        assert len(data["results"]) == 10
+        assert data["more"] is True
+        # 1, 10-19, 21, 31, …, 91 and 100, followed by 101 of the next page
+        assert consumed[-1] == 101
+
+    def test_get__cache(self, rf):
+        calls = []
+
+        def source():
+            calls.append(1)
+            return ["One", "Two"]
+
+        view = HeavyResponseView.as_view(source=source, cache_timeout=60)
+        first = self.get(rf, view, term="o", field_id="a")
+        assert self.get(rf, view, term="o", field_id="b") == first
+        assert len(calls) == 1
+        self.get(rf, view, term="t")
+        assert len(calls) == 2
+
+    def test_missing_source(self, rf):
+        with pytest.raises(ImproperlyConfigured):
+            HeavyResponseView.as_view()(rf.get("/numbers.json"))
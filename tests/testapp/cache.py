@@ -0,0 +1,20 @@
+import fnmatch
+import time
+
+from django.core.cache.backends.locmem import LocMemCache
+
+
+class RedisLikeCache(LocMemCache):
+    """Local stand-in for django-redis' ``iter_keys`` and ``ttl``."""
+
+    def iter_keys(self, search):
+        prefix = self.make_key("")
+        with self._lock:
+            keys = [key[len(prefix) :] for key in self._cache]
+        return (key for key in keys if fnmatch.fnmatchcase(key, search))
+
+    def ttl(self, key):
+        expires = self._expire_info.get(self.make_key(key))
+        if expires is None:
+            return None
+        return max(0, int(expires - time.time()))
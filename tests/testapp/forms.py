@@ -30,9 +30,7 @@ class TitleModelSelect2MultipleWidget(
 
 class GenreSelect2TagWidget(TitleSearchFieldMixin, ModelSelect2TagWidget):
     model = models.Genre
-
-    def create_value(self, value):
-        self.get_queryset().create(title=value)
+    natural_key_field = "title"
 
 
 class ArtistCustomTitleWidget(ModelSelect2Widget):
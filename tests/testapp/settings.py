@@ -3,7 +3,10 @@ import os.path
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DEBUG = True
 
-DATABASES = {"default": {"ENGINE": "django.db.backends.sqlite3", "NAME": ":memory:"}}
+DATABASES = {
+    "default": {"ENGINE": "django.db.backends.sqlite3", "NAME": ":memory:"},
+    "replica": {"ENGINE": "django.db.backends.sqlite3", "NAME": ":memory:"},
+}
 
 INSTALLED_APPS = (
     "django.contrib.auth",